@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Shared keyword tables and classifiers for trade finance documents
+One Aho-Corasick automaton over every keyword is built at import and shared
+by the OCR scripts in this directory
+"""
+
+from typing import Dict, List, Tuple
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Document type patterns with priority scoring: (keywords, document type, base confidence)
+DOCUMENT_PATTERNS = [
+    # High priority documents
+    (['letter of credit', 'documentary credit', 'l/c no', 'lc no', 'credit no', 'issuing bank', 'beneficiary'], 'Letter of Credit', 0.95),
+    (['commercial invoice', 'invoice no', 'inv no', 'seller', 'buyer', 'invoice date'], 'Commercial Invoice', 0.9),
+    (['bill of lading', 'b/l no', 'bl no', 'shipper', 'consignee', 'vessel', 'ocean bill'], 'Bill of Lading', 0.9),
+    (['certificate of origin', 'origin certificate', 'country of origin', 'chamber of commerce'], 'Certificate of Origin', 0.9),
+    (['packing list', 'package list', 'gross weight', 'net weight', 'dimensions', 'packages'], 'Packing List', 0.85),
+
+    # Medium priority documents
+    (['insurance certificate', 'policy no', 'marine insurance', 'cargo insurance', 'coverage'], 'Insurance Certificate', 0.8),
+    (['inspection certificate', 'survey certificate', 'quality certificate', 'test certificate'], 'Inspection Certificate', 0.8),
+    (['bill of exchange', 'draft', 'drawer', 'drawee', 'payee', 'tenor'], 'Bill of Exchange', 0.8),
+    (['transport document', 'multimodal transport', 'combined transport', 'freight receipt'], 'Transport Document', 0.75),
+    (['bank guarantee', 'guarantee no', 'guarantor', 'performance guarantee'], 'Bank Guarantee', 0.8),
+
+    # Specialized certificates
+    (['fumigation certificate', 'phytosanitary', 'plant health', 'pest control'], 'Fumigation Certificate', 0.8),
+    (['health certificate', 'sanitary certificate', 'veterinary certificate'], 'Health Certificate', 0.8),
+    (['weight certificate', 'weighing certificate', 'scale certificate'], 'Weight Certificate', 0.75),
+    (['quality analysis', 'laboratory report', 'test results', 'chemical analysis'], 'Quality Analysis', 0.75),
+
+    # Financial documents
+    (['payment receipt', 'receipt no', 'payment confirmation', 'remittance'], 'Payment Receipt', 0.7),
+    (['customs declaration', 'export declaration', 'import declaration'], 'Customs Declaration', 0.75),
+    (['freight invoice', 'shipping charges', 'freight charges'], 'Freight Invoice', 0.7),
+
+    # Generic patterns
+    (['certificate', 'certification', 'certified'], 'Certificate', 0.6),
+    (['receipt', 'acknowledgment'], 'Receipt', 0.5),
+    (['declaration', 'statement'], 'Declaration', 0.5),
+]
+
+# Quick classification keywords in priority order (first matching type wins)
+PRIORITY_RULES = [
+    ('Letter of Credit', ['letter of credit', 'l/c no', 'documentary credit', 'issuing bank']),
+    ('Commercial Invoice', ['commercial invoice', 'invoice no', 'seller', 'buyer']),
+    ('Bill of Lading', ['bill of lading', 'b/l no', 'shipper', 'consignee']),
+    ('Certificate of Origin', ['certificate of origin', 'country of origin']),
+    ('Packing List', ['packing list', 'gross weight', 'net weight']),
+    ('Insurance Certificate', ['insurance certificate', 'policy no', 'marine insurance']),
+    ('Inspection Certificate', ['inspection certificate', 'quality certificate']),
+    ('Bill of Exchange', ['bill of exchange', 'draft', 'drawer']),
+    ('Bank Guarantee', ['bank guarantee', 'performance guarantee']),
+    ('Customs Declaration', ['customs declaration', 'export declaration']),
+    ('Transport Document', ['transport document', 'freight forwarder']),
+    ('Weight Certificate', ['weight certificate', 'analysis certificate']),
+    ('Health Certificate', ['health certificate', 'sanitary certificate']),
+    ('Fumigation Certificate', ['fumigation certificate', 'phytosanitary']),
+    ('Certificate', ['certificate', 'certified']),
+]
+
+# First-page classification keywords in priority order: (document type, confidence, keywords)
+FIRST_PAGE_RULES = [
+    ('Commercial Invoice', 0.85, ['invoice', 'inv no', 'invoice number', 'seller', 'buyer', 'total amount']),
+    ('Bill of Lading', 0.85, ['bill of lading', 'b/l', 'vessel', 'port of loading', 'port of discharge', 'shipper', 'consignee']),
+    ('Certificate of Origin', 0.85, ['certificate of origin', 'country of origin', 'chamber of commerce', 'exporter', 'goods origin']),
+    ('Packing List', 0.85, ['packing list', 'package', 'gross weight', 'net weight', 'measurement', 'cbm']),
+    ('Insurance Certificate', 0.85, ['insurance certificate', 'policy number', 'insured amount', 'marine insurance', 'coverage']),
+    ('Vessel Certificate', 0.85, ['vessel certificate', 'certificate', 'vessel', 'ship', 'maritime', 'seaworthy', 'classification', 'registry']),
+    ('Multimodal Transport Document', 0.85, ['multimodal', 'transport document', 'combined transport', 'intermodal']),
+    # If still unknown, try partial matches
+    ('General Certificate', 0.60, ['certificate', 'document', 'transport']),
+]
+
+def build_keyword_automaton(keywords):
+    """
+    Build an Aho-Corasick automaton over the keywords (None if pyahocorasick is unavailable)
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, (keyword, KEYWORD_BITS[keyword]))
+    automaton.make_automaton()
+    return automaton
+
+def build_pattern_automaton(pattern_lists):
+    """
+    Build an Aho-Corasick automaton over lists of lowercase patterns, mapping each
+    pattern to its (list index, pattern index) locations (None if pyahocorasick is unavailable)
+    """
+    if ahocorasick is None:
+        return None
+    locations = {}
+    for list_index, patterns in enumerate(pattern_lists):
+        for pattern_index, pattern in enumerate(patterns):
+            locations.setdefault(pattern, []).append((list_index, pattern_index))
+    automaton = ahocorasick.Automaton()
+    for pattern, pattern_locations in locations.items():
+        automaton.add_word(pattern, pattern_locations)
+    automaton.make_automaton()
+    return automaton
+
+def find_pattern_hits(automaton, pattern_lists, text_lower: str) -> List[set]:
+    """
+    Return, per pattern list, the set of pattern indices found in lowercased text
+    """
+    hits = [set() for _ in pattern_lists]
+    if automaton is None:
+        for list_index, patterns in enumerate(pattern_lists):
+            hits[list_index].update(i for i, pattern in enumerate(patterns) if pattern in text_lower)
+        return hits
+    for _, pattern_locations in automaton.iter(text_lower):
+        for list_index, pattern_index in pattern_locations:
+            hits[list_index].add(pattern_index)
+    return hits
+
+def build_keyword_index(patterns) -> Dict[str, List[int]]:
+    """
+    Map each keyword to the indices of the patterns that list it
+    """
+    keyword_index = {}
+    for index, (keywords, _, _) in enumerate(patterns):
+        for keyword in keywords:
+            keyword_index.setdefault(keyword, []).append(index)
+    return keyword_index
+
+KEYWORD_PATTERNS = build_keyword_index(DOCUMENT_PATTERNS)
+
+# Highest confidence any pattern after position i can still reach
+REMAINING_MAX_CONFIDENCE = [
+    max((min(base + (len(keywords) - 1) * 0.05, 0.98) for keywords, _, base in DOCUMENT_PATTERNS[i + 1:]), default=0.0)
+    for i in range(len(DOCUMENT_PATTERNS))
+]
+
+ALL_KEYWORDS = sorted(
+    set(KEYWORD_PATTERNS)
+    | {keyword for _, keywords in PRIORITY_RULES for keyword in keywords}
+    | {keyword for _, _, keywords in FIRST_PAGE_RULES for keyword in keywords}
+)
+
+# Each keyword gets one bit; a document type is the OR of its keywords' bits
+KEYWORD_BITS = {keyword: 1 << keyword_id for keyword_id, keyword in enumerate(ALL_KEYWORDS)}
+
+def keywords_mask(keywords) -> int:
+    """
+    Combine the bits of the given keywords into one mask
+    """
+    mask = 0
+    for keyword in keywords:
+        mask |= KEYWORD_BITS[keyword]
+    return mask
+
+PRIORITY_MASKS = [(doc_type, keywords_mask(keywords)) for doc_type, keywords in PRIORITY_RULES]
+FIRST_PAGE_MASKS = [(doc_type, confidence, keywords_mask(keywords)) for doc_type, confidence, keywords in FIRST_PAGE_RULES]
+
+AUTOMATON = build_keyword_automaton(ALL_KEYWORDS)
+
+def find_keywords(text_lower: str) -> set:
+    """
+    Return the set of known keywords present in lowercased text in a single pass
+    """
+    if AUTOMATON is None:
+        return {keyword for keyword in ALL_KEYWORDS if keyword in text_lower}
+    return {keyword for _, (keyword, _) in AUTOMATON.iter(text_lower)}
+
+def find_keywords_mask(text_lower: str) -> int:
+    """
+    Return the bitmask of known keywords present in lowercased text in a single pass
+    """
+    if AUTOMATON is None:
+        return keywords_mask(keyword for keyword in ALL_KEYWORDS if keyword in text_lower)
+    mask = 0
+    for _, (_, bit) in AUTOMATON.iter(text_lower):
+        mask |= bit
+    return mask
+
+def classify(text: str) -> Tuple[str, float]:
+    """
+    Score text against DOCUMENT_PATTERNS and return (document type, confidence)
+    """
+    return classify_lowercase(text.lower())
+
+def classify_lowercase(text_lower: str) -> Tuple[str, float]:
+    """
+    Same as classify, for text the caller has already lowercased
+    """
+    found = find_keywords(text_lower)
+
+    # Find best matching document type
+    best_match = ('Trade Finance Document', 0.3)
+
+    # Tally distinct keyword hits per pattern straight from the automaton hits
+    match_counts = [0] * len(DOCUMENT_PATTERNS)
+    for keyword in found:
+        for index in KEYWORD_PATTERNS.get(keyword, ()):
+            match_counts[index] += 1
+
+    for index, (_, doc_type, base_confidence) in enumerate(DOCUMENT_PATTERNS):
+        matches = match_counts[index]
+        if matches > 0:
+            # Calculate confidence based on keyword matches
+            confidence = min(base_confidence + (matches - 1) * 0.05, 0.98)
+            if confidence > best_match[1]:
+                best_match = (doc_type, confidence)
+
+        # Stop once no remaining pattern can beat the current best
+        if best_match[1] >= REMAINING_MAX_CONFIDENCE[index]:
+            break
+
+    return best_match
+
+def classify_by_priority(text: str) -> str:
+    """
+    Return the first PRIORITY_RULES type with a keyword in text, or 'Unknown'
+    """
+    hits_mask = find_keywords_mask(text.lower())
+
+    for doc_type, type_mask in PRIORITY_MASKS:
+        if hits_mask & type_mask:
+            return doc_type
+    return 'Unknown'
+
+def classify_first_page(text: str) -> Tuple[str, float]:
+    """
+    Return the first FIRST_PAGE_RULES match as (document type, confidence)
+    """
+    hits_mask = find_keywords_mask(text.lower())
+
+    for doc_type, confidence, type_mask in FIRST_PAGE_MASKS:
+        if hits_mask & type_mask:
+            return doc_type, confidence
+    return "Unknown Document", 0.0
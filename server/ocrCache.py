@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of extracted page text keyed by PDF content hash
+Lets repeated runs on the same PDF skip text extraction and OCR
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from typing import List, Optional
+
+CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ocr_cache'))
+
+# Part of every cache key; bump it whenever an extractor's output for the same PDF changes
+# (OCR engine or settings, render scale, text cleanup) so older entries are never served
+CACHE_VERSION = 2
+
+# Oldest entries are removed once the cache directory grows past this many bytes
+CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+def get_cache_path(pdf_path: str, namespace: str, pdf_bytes: Optional[bytes] = None) -> str:
+    """
+    Cache file for a PDF, keyed by its SHA1 and size, the extractor namespace and CACHE_VERSION.
+    Hashes pdf_bytes instead of rereading the file when the caller already has them.
+    """
+    if pdf_bytes is not None:
+        sha1 = hashlib.sha1(pdf_bytes)
+        size = len(pdf_bytes)
+    else:
+        sha1 = hashlib.sha1()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        size = os.path.getsize(pdf_path)
+
+    return os.path.join(CACHE_DIR, f"{namespace}-v{CACHE_VERSION}-{sha1.hexdigest()}-{size}.json")
+
+def load_cached_text(cache_path: str) -> Optional[List[str]]:
+    """
+    Return cached per-page text, or None on a cache miss
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            pages = json.load(f)['pages']
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Mark the entry as recently used so pruning removes colder entries first
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+    return pages
+
+def ensure_private_dir(cache_dir: str) -> bool:
+    """
+    Create the cache directory readable only by this user; False if it belongs to someone else
+    """
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    if os.stat(cache_dir).st_uid != os.getuid():
+        return False
+    os.chmod(cache_dir, 0o700)
+    return True
+
+def prune_cache(cache_dir: str, max_bytes: int) -> None:
+    """
+    Remove the least recently used entries until the directory is within max_bytes
+    """
+    entries = []
+    total_bytes = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.json') and entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_bytes -= size
+        except OSError:
+            pass
+
+def save_cached_text(cache_path: str, page_texts: List[str]) -> None:
+    """
+    Atomically write per-page text to the cache (owner-only permissions); failures are non-fatal
+    """
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if not ensure_private_dir(cache_dir):
+            return
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'pages': page_texts}, f)
+        os.replace(tmp_path, cache_path)
+        prune_cache(cache_dir, CACHE_MAX_BYTES)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Long-lived OCR worker for the Node.js server
+Reads one JSON request per line from stdin and writes one JSON response per line to stdout,
+so fitz, OpenCV, tesseract and the keyword automaton are loaded once instead of per PDF
+
+Request:  {"id": "...", "script": "quickOCR", "pdf_path": "/path/to/file.pdf"}
+Response: {"id": "...", "result": {...}} or {"id": "...", "error": "..."}
+"""
+
+import sys
+import os
+import json
+from quickOCR import analyze_pdf
+from quickOpenCVAnalyzer import quick_analyze_document
+from realDocumentProcessor import extract_real_text_from_pdf
+
+# Script name (as previously spawned by Node) -> in-process entry point
+HANDLERS = {
+    'quickOCR': analyze_pdf,
+    'quickOpenCVAnalyzer': quick_analyze_document,
+    'realDocumentProcessor': extract_real_text_from_pdf,
+}
+
+def dispatch(script: str, pdf_path: str) -> dict:
+    """
+    Run one request through the handler registered for the script
+    """
+    handler = HANDLERS.get(script)
+    if handler is None:
+        raise ValueError(f"Unknown script: {script}")
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"File not found: {pdf_path}")
+    return handler(pdf_path)
+
+def main():
+    print(f"OCR daemon ready ({', '.join(HANDLERS)})", file=sys.stderr)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = {'id': request_id, 'result': dispatch(request['script'], request['pdf_path'])}
+        except Exception as e:
+            response = {'id': request_id, 'error': str(e)}
+
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+/**
+ * OCR Daemon Client
+ * Keeps one long-lived server/ocrDaemon.py process and sends it one JSON request per line,
+ * instead of spawning a fresh Python interpreter (and reloading OCR libraries) per PDF
+ */
+
+import { spawn, ChildProcess } from 'child_process';
+import { createInterface } from 'readline';
+
+export type OcrDaemonScript = 'quickOCR' | 'quickOpenCVAnalyzer' | 'realDocumentProcessor';
+
+interface PendingRequest {
+  daemon: ChildProcess;
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+}
+
+export class OcrDaemonClient {
+  private daemonProcess: ChildProcess | null = null;
+  private pending = new Map<string, PendingRequest>();
+  private nextId = 0;
+
+  /**
+   * Start the daemon on first use and restart it if it has exited
+   */
+  private ensureDaemon(): ChildProcess {
+    if (this.daemonProcess && this.daemonProcess.exitCode === null) {
+      return this.daemonProcess;
+    }
+
+    const daemon = spawn('python3', ['server/ocrDaemon.py'], {
+      stdio: ['pipe', 'pipe', 'pipe'],
+      env: { ...process.env }
+    });
+
+    createInterface({ input: daemon.stdout! }).on('line', (line) => {
+      let response: any;
+      try {
+        response = JSON.parse(line);
+      } catch (error) {
+        console.error('OCR daemon sent invalid JSON:', line);
+        return;
+      }
+
+      const request = this.pending.get(response.id);
+      if (!request) return;
+      this.pending.delete(response.id);
+
+      if (response.error) {
+        request.reject(new Error(response.error));
+      } else {
+        request.resolve(response.result);
+      }
+    });
+
+    daemon.stderr?.on('data', (data) => {
+      console.log(`OCR daemon: ${data.toString().trim()}`);
+    });
+
+    // Spawn failures and writes to a dead daemon must fail the requests, not crash the server
+    daemon.on('error', (error) => {
+      console.error('OCR daemon error:', error);
+      this.rejectAll(daemon, error);
+      if (this.daemonProcess === daemon) {
+        this.daemonProcess = null;
+      }
+    });
+    daemon.stdin?.on('error', (error) => {
+      console.error('OCR daemon stdin error:', error);
+    });
+
+    daemon.on('close', (code) => {
+      console.log(`OCR daemon exited with code ${code}`);
+      this.rejectAll(daemon, new Error(`OCR daemon exited with code ${code}`));
+      if (this.daemonProcess === daemon) {
+        this.daemonProcess = null;
+      }
+    });
+
+    this.daemonProcess = daemon;
+    return daemon;
+  }
+
+  /**
+   * Fail every request still waiting on the given daemon process
+   */
+  private rejectAll(daemon: ChildProcess, error: Error): void {
+    for (const [id, request] of Array.from(this.pending.entries())) {
+      if (request.daemon === daemon) {
+        this.pending.delete(id);
+        request.reject(error);
+      }
+    }
+  }
+
+  /**
+   * Kill a daemon process, failing its outstanding requests; the next request starts a fresh one
+   */
+  private killDaemon(daemon: ChildProcess, error: Error): void {
+    if (this.daemonProcess === daemon) {
+      this.daemonProcess = null;
+    }
+    this.rejectAll(daemon, error);
+    daemon.kill('SIGKILL');
+  }
+
+  /**
+   * Process a PDF with one of the daemon's analyzers, failing after timeoutMs if given
+   */
+  run(script: OcrDaemonScript, pdfPath: string, timeoutMs?: number): Promise<any> {
+    const daemon = this.ensureDaemon();
+    const id = String(++this.nextId);
+
+    return new Promise((resolve, reject) => {
+      let timer: NodeJS.Timeout | undefined;
+      this.pending.set(id, {
+        daemon,
+        resolve: (result) => { clearTimeout(timer); resolve(result); },
+        reject: (error) => { clearTimeout(timer); reject(error); }
+      });
+      if (timeoutMs) {
+        timer = setTimeout(() => {
+          if (!this.pending.delete(id)) return;
+          reject(new Error(`OCR daemon timed out after ${timeoutMs}ms`));
+          // The daemon works through requests one at a time and cannot abandon one, so an
+          // overrunning request is stopped by killing it; requests queued behind fail over too
+          this.killDaemon(daemon, new Error('OCR daemon restarted after a request timed out'));
+        }, timeoutMs);
+      }
+      daemon.stdin!.write(JSON.stringify({ id, script, pdf_path: pdfPath }) + '\n');
+    });
+  }
+
+  /**
+   * Stop the daemon process
+   */
+  stop(): void {
+    if (this.daemonProcess) {
+      this.daemonProcess.stdin?.end();
+      this.daemonProcess = null;
+    }
+  }
+}
+
+export const ocrDaemonClient = new OcrDaemonClient();
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tesseract engine setup and the OCR worker pool shared by the PDF processors
+Processors import tesserocr through this module so the thread limit below is in place first
+"""
+
+import os
+import sys
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pdfSource import open_pdf_stream
+
+# Pages are spread across worker processes, so tesseract's own OpenMP threads only compete
+# with them for cores. OpenMP reads the limit once, when libtesseract is loaded, so it is set
+# before the tesserocr import; forked workers and tesseract subprocesses inherit it
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
+# Scanned pages are OCRed in parallel across this many worker processes
+OCR_WORKERS = os.cpu_count() or 1
+# Chunked pools send pages in runs of consecutive pages, about this many runs per worker: fewer
+# round trips than one task per page, while a slow page still cannot hold up a whole share
+OCR_CHUNKS_PER_WORKER = 4
+
+def create_ocr_api(psm: str = 'SINGLE_BLOCK', oem: str = 'DEFAULT',
+                   variables: Optional[Dict[str, str]] = None):
+    """
+    Create a reusable in-process tesseract engine (None if tesserocr is unavailable)
+    psm and oem name tesserocr PSM / OEM members; variables are tesseract settings
+    """
+    if PyTessBaseAPI is None:
+        return None
+    try:
+        api = PyTessBaseAPI(lang='eng', psm=getattr(PSM, psm), oem=getattr(OEM, oem))
+    except RuntimeError as init_error:
+        print(f"tesserocr unavailable, using pytesseract: {init_error}", file=sys.stderr)
+        return None
+    for name, value in (variables or {}).items():
+        api.SetVariable(name, value)
+    return api
+
+# Per-worker-process document and OCR engine, set up once by init_ocr_worker
+_worker_doc = None
+_worker_api = None
+
+def init_ocr_worker(pdf_bytes: bytes, api_settings: Dict[str, Any],
+                    setup: Optional[Callable[[], None]]) -> None:
+    """
+    Worker initializer: open the PDF and load the tesseract model once per worker process
+    """
+    global _worker_doc, _worker_api
+    if setup is not None:
+        setup()
+    _worker_doc = open_pdf_stream(pdf_bytes)
+    _worker_api = create_ocr_api(**api_settings)
+
+def run_worker_request(ocr_request_func: Callable, ocr_request: Any) -> Any:
+    """
+    Worker entry point: run one OCR request against the worker's PDF and engine
+    """
+    return ocr_request_func(_worker_doc, ocr_request, _worker_api)
+
+def map_ocr_requests(ocr_request_func: Callable, pdf_bytes: bytes, ocr_requests: Sequence,
+                     api_settings: Dict[str, Any], setup: Optional[Callable[[], None]] = None,
+                     chunked: bool = False) -> Iterator:
+    """
+    Yield ocr_request_func(doc, request, api) for each request, in order, from worker processes.
+    ocr_request_func and setup must be module-level functions (or partials of them) so they pickle;
+    chunked sends requests in runs of OCR_CHUNKS_PER_WORKER per worker instead of one at a time
+    """
+    workers = min(OCR_WORKERS, len(ocr_requests))
+    chunksize = 1
+    if chunked:
+        chunksize = max(1, len(ocr_requests) // (workers * OCR_CHUNKS_PER_WORKER))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_ocr_worker,
+                             initargs=(pdf_bytes, api_settings, setup)) as executor:
+        yield from executor.map(partial(run_worker_request, ocr_request_func), ocr_requests,
+                                chunksize=chunksize)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Open PDFs from an in-memory byte stream
+A request reads the file once and hands the same bytes to every processor and OCR worker
+"""
+
+import fitz
+from typing import Optional, Tuple
+
+# Malformed scans trigger many MuPDF repair messages; keep them off stderr, which the
+# Node.js callers read as progress output (they stay available in fitz.TOOLS.mupdf_warnings())
+fitz.TOOLS.mupdf_display_errors(False)
+
+def read_pdf_bytes(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> bytes:
+    """
+    Return the PDF's bytes, reading the file only if the caller has not already done so
+    """
+    if pdf_bytes is not None:
+        return pdf_bytes
+    with open(pdf_path, 'rb') as f:
+        return f.read()
+
+def open_pdf_stream(pdf_bytes: bytes) -> fitz.Document:
+    """
+    Open a PDF document from bytes already in memory
+    """
+    return fitz.open(stream=pdf_bytes, filetype='pdf')
+
+def open_pdf(pdf_path: str, pdf_bytes: Optional[bytes] = None) -> Tuple[fitz.Document, bytes]:
+    """
+    Open a PDF from its bytes (read from pdf_path if not given), returning (document, bytes)
+    """
+    pdf_bytes = read_pdf_bytes(pdf_path, pdf_bytes)
+    return open_pdf_stream(pdf_bytes), pdf_bytes
@@ -6,22 +6,18 @@ import fitz
 import json
 import sys
 import os
+from ocrCache import get_cache_path, load_cached_text, save_cached_text
+from keywordClassifier import classify_first_page
 
-def main():
-    if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python quickOCR.py <pdf_path>"}))
-        sys.exit(1)
-    
-    pdf_path = sys.argv[1]
-    
-    if not os.path.exists(pdf_path):
-        print(json.dumps({"error": f"File not found: {pdf_path}"}))
-        sys.exit(1)
-    
-    try:
-        # Extract text from PDF
-        doc = fitz.open(pdf_path)
+def extract_first_page_text(pdf_path):
+    """
+    Extract text from the first page, using OCR when there is no text layer.
+    Returns (text, ocr_failed).
+    """
+    # Closed on every exit path; this also runs inside the long-lived OCR daemon
+    with fitz.open(pdf_path) as doc:
         text = ""
+        ocr_failed = False
         
         # Process first page only for speed
         if len(doc) > 0:
@@ -33,66 +29,38 @@ def main():
                 try:
                     import pytesseract
                     from PIL import Image
-                    import io
                     
-                    # Get image from PDF page
-                    pix = page.get_pixmap()
-                    img_data = pix.tobytes("png")
-                    img = Image.open(io.BytesIO(img_data))
+                    # Get grayscale image from PDF page
+                    pix = page.get_pixmap(colorspace=fitz.csGRAY, alpha=False)
+                    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
                     
                     # Perform OCR
                     text = pytesseract.image_to_string(img)
                 except Exception as ocr_error:
                     text = f"OCR processing failed: {str(ocr_error)}"
+                    ocr_failed = True
+    
+    return text, ocr_failed
+
+def analyze_pdf(pdf_path):
+    """
+    Extract and classify the first page of a PDF; returns the result dict
+    """
+    try:
+        cache_path = get_cache_path(pdf_path, 'quickOCR')
+        cached = load_cached_text(cache_path)
         
-        doc.close()
+        if cached is not None:
+            text = cached[0]
+        else:
+            text, ocr_failed = extract_first_page_text(pdf_path)
+            if not ocr_failed:
+                save_cached_text(cache_path, [text])
         
         # Content-based classification using extracted text only
-        text_lower = text.lower()
-        doc_type = "Unknown Document"
-        confidence = 0.0
-        
-        # Commercial Invoice patterns
-        if any(keyword in text_lower for keyword in ['invoice', 'inv no', 'invoice number', 'seller', 'buyer', 'total amount']):
-            doc_type = "Commercial Invoice"
-            confidence = 0.85
-        
-        # Bill of Lading patterns
-        elif any(keyword in text_lower for keyword in ['bill of lading', 'b/l', 'vessel', 'port of loading', 'port of discharge', 'shipper', 'consignee']):
-            doc_type = "Bill of Lading"
-            confidence = 0.85
-        
-        # Certificate of Origin patterns
-        elif any(keyword in text_lower for keyword in ['certificate of origin', 'country of origin', 'chamber of commerce', 'exporter', 'goods origin']):
-            doc_type = "Certificate of Origin"
-            confidence = 0.85
+        doc_type, confidence = classify_first_page(text)
         
-        # Packing List patterns
-        elif any(keyword in text_lower for keyword in ['packing list', 'package', 'gross weight', 'net weight', 'measurement', 'cbm']):
-            doc_type = "Packing List"
-            confidence = 0.85
-        
-        # Insurance Certificate patterns
-        elif any(keyword in text_lower for keyword in ['insurance certificate', 'policy number', 'insured amount', 'marine insurance', 'coverage']):
-            doc_type = "Insurance Certificate"
-            confidence = 0.85
-        
-        # Vessel Certificate patterns (NEW)
-        elif any(keyword in text_lower for keyword in ['vessel certificate', 'certificate', 'vessel', 'ship', 'maritime', 'seaworthy', 'classification', 'registry']):
-            doc_type = "Vessel Certificate"
-            confidence = 0.85
-        
-        # Multimodal Transport patterns
-        elif any(keyword in text_lower for keyword in ['multimodal', 'transport document', 'combined transport', 'intermodal']):
-            doc_type = "Multimodal Transport Document"
-            confidence = 0.85
-        
-        # If still unknown, try partial matches
-        elif any(keyword in text_lower for keyword in ['certificate', 'document', 'transport']):
-            doc_type = "General Certificate"
-            confidence = 0.60
-        
-        result = {
+        return {
             "extracted_text": text if text.strip() else f"Scanned document detected from file: {os.path.basename(pdf_path)}",
             "document_type": doc_type,
             "confidence": confidence,
@@ -100,17 +68,27 @@ def main():
             "preview": text[:300] + "..." if len(text) > 300 else text
         }
         
-        print(json.dumps(result))
-        
     except Exception as e:
-        error_result = {
+        return {
             "error": f"Processing error: {str(e)}",
             "document_type": "Unknown Document",
             "confidence": 0,
             "extracted_text": "",
             "text_length": 0
         }
-        print(json.dumps(error_result))
+
+def main():
+    if len(sys.argv) != 2:
+        print(json.dumps({"error": "Usage: python quickOCR.py <pdf_path>"}))
+        sys.exit(1)
+    
+    pdf_path = sys.argv[1]
+    
+    if not os.path.exists(pdf_path):
+        print(json.dumps({"error": f"File not found: {pdf_path}"}))
+        sys.exit(1)
+    
+    print(json.dumps(analyze_pdf(pdf_path)))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
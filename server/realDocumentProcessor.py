@@ -9,63 +9,67 @@ import json
 import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-import io
 import re
 from typing import List, Dict, Any
+from ocrCache import get_cache_path, load_cached_text, save_cached_text
+from ocrWorkers import OCR_WORKERS, create_ocr_api, map_ocr_requests
+from pdfSource import open_pdf, read_pdf_bytes
+from keywordClassifier import classify_lowercase
 
-def extract_real_text_from_pdf(pdf_path: str) -> Dict[str, Any]:
+# Render scales for OCR: image-only pages vs pages with a partial text layer
+OCR_SCALE = 1.5
+PARTIAL_TEXT_OCR_SCALE = 1.0
+
+# Identifiers are extracted only for pages classified at least this confidently,
+# and only from the leading part of the page text
+IDENTIFIER_MIN_CONFIDENCE = 0.7
+IDENTIFIER_SCAN_CHARS = 2000
+
+# Common document number patterns, in preference order
+ID_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:no|number|ref|id)[.:\s]+([a-z0-9\-/]{3,20})',
+    r'([a-z]{2,4}[-_/]\d{3,8})',
+    r'(\d{4,8}[-_/][a-z0-9]{2,8})',
+    r'([a-z]{3,6}\d{3,8})',
+    r'(\d{8,12})',
+)]
+
+def extract_real_text_from_pdf(pdf_path: str, pdf_bytes: bytes = None) -> Dict[str, Any]:
     """
     Extract real text from PDF using both direct text extraction and OCR
     """
     try:
-        doc = fitz.open(pdf_path)
-        total_pages = doc.page_count
-        detected_pages = []
+        # Read the file once for both the cache key and the extraction
+        pdf_bytes = read_pdf_bytes(pdf_path, pdf_bytes)
+        cache_path = get_cache_path(pdf_path, 'realDocumentProcessor', pdf_bytes)
+        page_texts = load_cached_text(cache_path)
         
-        print(f"Processing {total_pages} pages from real PDF...", file=sys.stderr)
+        if page_texts is None:
+            page_texts, complete = extract_page_texts(pdf_path, pdf_bytes)
+            if complete:
+                save_cached_text(cache_path, page_texts)
+        else:
+            print(f"Using cached text for {len(page_texts)} pages", file=sys.stderr)
         
-        for page_num in range(total_pages):
-            try:
-                page = doc[page_num]
-                
-                # Try direct text extraction first
-                text = page.get_text()
+        total_pages = len(page_texts)
+        detected_pages = []
+        
+        for page_num, text in enumerate(page_texts):
+            clean = text.strip()
+            if len(clean) > 5:
+                # Analyze document type based on real content
+                doc_type, confidence = analyze_document_type(clean.lower())
                 
-                # If minimal text found, use OCR (faster processing for large documents)
-                if len(text.strip()) < 30:
-                    try:
-                        # Convert page to image with moderate resolution for speed
-                        pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-                        img_data = pix.tobytes("png")
-                        image = Image.open(io.BytesIO(img_data))
-                        
-                        # Use OCR with faster config for speed
-                        ocr_text = pytesseract.image_to_string(image, config='--psm 6')
-                        if len(ocr_text.strip()) > len(text.strip()):
-                            text = ocr_text
-                    except Exception as ocr_error:
-                        print(f"OCR failed for page {page_num + 1}: {ocr_error}", file=sys.stderr)
+                detected_pages.append({
+                    'page_number': page_num + 1,
+                    'document_type': doc_type,
+                    'form_type': doc_type,
+                    'confidence': confidence,
+                    'extracted_text': clean,
+                    'text_length': len(clean)
+                })
                 
-                if len(text.strip()) > 5:
-                    # Analyze document type based on real content
-                    doc_type, confidence = analyze_document_type(text, page_num + 1)
-                    
-                    detected_pages.append({
-                        'page_number': page_num + 1,
-                        'document_type': doc_type,
-                        'form_type': doc_type,
-                        'confidence': confidence,
-                        'extracted_text': text.strip(),
-                        'text_length': len(text.strip())
-                    })
-                    
-                    print(f"Page {page_num + 1}: {doc_type} (confidence: {confidence})", file=sys.stderr)
-                    
-            except Exception as page_error:
-                print(f"Error processing page {page_num + 1}: {page_error}", file=sys.stderr)
-                continue
-        
-        doc.close()
+                print(f"Page {page_num + 1}: {doc_type} (confidence: {confidence})", file=sys.stderr)
         
         # Group pages into documents based on type and content similarity
         grouped_documents = group_documents_intelligently(detected_pages)
@@ -87,61 +91,107 @@ def extract_real_text_from_pdf(pdf_path: str) -> Dict[str, Any]:
             'processing_method': 'Real PDF Analysis with OCR'
         }
 
-def analyze_document_type(text: str, page_num: int) -> tuple:
+def extract_page_texts(pdf_path: str, pdf_bytes: bytes = None) -> tuple:
     """
-    Analyze document type based on real extracted text content
+    Extract text for every page, falling back to OCR for image-only pages.
+    Returns (page_texts, complete) where complete is False if any page failed.
     """
-    text_lower = text.lower()
+    # Read the file once (unless the caller already has); the parent and every OCR worker open it from these bytes
+    doc, pdf_bytes = open_pdf(pdf_path, pdf_bytes)
+    total_pages = doc.page_count
+    page_texts = []
+    complete = True
     
-    # Extract document numbers and identifiers
-    doc_numbers = extract_document_identifiers(text)
+    print(f"Processing {total_pages} pages from real PDF...", file=sys.stderr)
     
-    # Document type patterns with priority scoring
-    document_patterns = [
-        # High priority documents
-        (['letter of credit', 'documentary credit', 'l/c no', 'lc no', 'credit no', 'issuing bank', 'beneficiary'], 'Letter of Credit', 0.95),
-        (['commercial invoice', 'invoice no', 'inv no', 'seller', 'buyer', 'invoice date'], 'Commercial Invoice', 0.9),
-        (['bill of lading', 'b/l no', 'bl no', 'shipper', 'consignee', 'vessel', 'ocean bill'], 'Bill of Lading', 0.9),
-        (['certificate of origin', 'origin certificate', 'country of origin', 'chamber of commerce'], 'Certificate of Origin', 0.9),
-        (['packing list', 'package list', 'gross weight', 'net weight', 'dimensions', 'packages'], 'Packing List', 0.85),
-        
-        # Medium priority documents
-        (['insurance certificate', 'policy no', 'marine insurance', 'cargo insurance', 'coverage'], 'Insurance Certificate', 0.8),
-        (['inspection certificate', 'survey certificate', 'quality certificate', 'test certificate'], 'Inspection Certificate', 0.8),
-        (['bill of exchange', 'draft', 'drawer', 'drawee', 'payee', 'tenor'], 'Bill of Exchange', 0.8),
-        (['transport document', 'multimodal transport', 'combined transport', 'freight receipt'], 'Transport Document', 0.75),
-        (['bank guarantee', 'guarantee no', 'guarantor', 'performance guarantee'], 'Bank Guarantee', 0.8),
-        
-        # Specialized certificates
-        (['fumigation certificate', 'phytosanitary', 'plant health', 'pest control'], 'Fumigation Certificate', 0.8),
-        (['health certificate', 'sanitary certificate', 'veterinary certificate'], 'Health Certificate', 0.8),
-        (['weight certificate', 'weighing certificate', 'scale certificate'], 'Weight Certificate', 0.75),
-        (['quality analysis', 'laboratory report', 'test results', 'chemical analysis'], 'Quality Analysis', 0.75),
-        
-        # Financial documents
-        (['payment receipt', 'receipt no', 'payment confirmation', 'remittance'], 'Payment Receipt', 0.7),
-        (['customs declaration', 'export declaration', 'import declaration'], 'Customs Declaration', 0.75),
-        (['freight invoice', 'shipping charges', 'freight charges'], 'Freight Invoice', 0.7),
-        
-        # Generic patterns
-        (['certificate', 'certification', 'certified'], 'Certificate', 0.6),
-        (['receipt', 'acknowledgment'], 'Receipt', 0.5),
-        (['declaration', 'statement'], 'Declaration', 0.5),
+    # Try direct text extraction first
+    for page_num in range(total_pages):
+        try:
+            page_texts.append(doc[page_num].get_text())
+        except Exception as page_error:
+            complete = False
+            page_texts.append(None)
+            print(f"Error processing page {page_num + 1}: {page_error}", file=sys.stderr)
+    
+    # If minimal text found, use OCR (faster processing for large documents)
+    ocr_pages = [
+        (page_num, ocr_render_scale(text))
+        for page_num, text in enumerate(page_texts)
+        if text is not None and len(text.strip()) < 30
     ]
     
+    if len(ocr_pages) > 1 and OCR_WORKERS > 1:
+        ocr_results = list(map_ocr_requests(ocr_request_page, pdf_bytes, ocr_pages, {}))
+    elif ocr_pages:
+        # One OCR engine for the whole document instead of one per page
+        api = create_ocr_api()
+        try:
+            ocr_results = [ocr_document_page(doc, page_num, scale, api) for page_num, scale in ocr_pages]
+        finally:
+            if api is not None:
+                api.End()
+    else:
+        ocr_results = []
+    
+    doc.close()
+    
+    for page_num, ocr_text, ocr_error in ocr_results:
+        if ocr_error is not None:
+            complete = False
+            print(f"OCR failed for page {page_num + 1}: {ocr_error}", file=sys.stderr)
+        elif len(ocr_text.strip()) > len(page_texts[page_num].strip()):
+            page_texts[page_num] = ocr_text
+    
+    return [text or '' for text in page_texts], complete
+
+def ocr_render_scale(direct_text: str) -> float:
+    """
+    Render scale for OCR: pages with a partial text layer only need a cheap pass
+    """
+    if len(direct_text.strip()) >= 5:
+        return PARTIAL_TEXT_OCR_SCALE
+    return OCR_SCALE
+
+def ocr_document_page(doc, page_num: int, scale: float, api=None) -> tuple:
+    """
+    OCR a single page, reusing the given tesserocr engine if any. Returns (page_num, text, error).
+    """
+    try:
+        # Convert page to 8-bit grayscale image with moderate resolution for speed
+        pix = doc[page_num].get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        
+        if api is not None:
+            api.SetImage(image)
+            return page_num, api.GetUTF8Text(), None
+        
+        # Use OCR with faster config for speed
+        return page_num, pytesseract.image_to_string(image, config='--psm 6'), None
+    except Exception as ocr_error:
+        return page_num, None, str(ocr_error)
+
+def ocr_request_page(doc, ocr_page: tuple, api=None) -> tuple:
+    """
+    Worker pool entry point: OCR one (page_num, scale) request
+    """
+    page_num, scale = ocr_page
+    return ocr_document_page(doc, page_num, scale, api)
+
+def analyze_document_type(text_lower: str) -> tuple:
+    """
+    Analyze document type based on real extracted text content (already lowercased)
+    """
     # Find best matching document type
-    best_match = ('Trade Finance Document', 0.3)
+    doc_type, confidence = classify_lowercase(text_lower)
+    
+    # Only confidently classified pages are labelled with a document identifier
+    if confidence < IDENTIFIER_MIN_CONFIDENCE:
+        return doc_type, confidence
     
-    for keywords, doc_type, base_confidence in document_patterns:
-        matches = sum(1 for keyword in keywords if keyword in text_lower)
-        if matches > 0:
-            # Calculate confidence based on keyword matches
-            confidence = min(base_confidence + (matches - 1) * 0.05, 0.98)
-            if confidence > best_match[1]:
-                best_match = (doc_type, confidence)
+    # Extract document numbers and identifiers (they appear near the top of trade documents)
+    doc_numbers = extract_document_identifiers(text_lower[:IDENTIFIER_SCAN_CHARS])
     
     # Add document identifier to type if found
-    doc_type, confidence = best_match
     if doc_numbers:
         # Use first document number as identifier
         identifier = doc_numbers[0][:15]  # Limit length
@@ -149,30 +199,18 @@ def analyze_document_type(text: str, page_num: int) -> tuple:
     
     return doc_type, confidence
 
-def extract_document_identifiers(text: str) -> List[str]:
+def extract_document_identifiers(text_lower: str) -> List[str]:
     """
-    Extract document numbers, references, and identifiers from text
+    Extract document numbers, references, and identifiers from lowercased text
     """
-    identifiers = []
-    
-    # Common document number patterns
-    patterns = [
-        r'(?:no|number|ref|id)[.:\s]+([a-z0-9\-/]{3,20})',
-        r'([a-z]{2,4}[-_/]\d{3,8})',
-        r'(\d{4,8}[-_/][a-z0-9]{2,8})',
-        r'([a-z]{3,6}\d{3,8})',
-        r'(\d{8,12})',
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text.lower(), re.IGNORECASE)
-        identifiers.extend(matches)
-    
     # Remove duplicates and filter valid identifiers
     unique_identifiers = []
-    for identifier in identifiers:
-        if len(identifier) >= 3 and identifier not in unique_identifiers:
-            unique_identifiers.append(identifier)
+    for pattern in ID_PATTERNS:
+        for identifier in pattern.findall(text_lower):
+            if len(identifier) >= 3 and identifier not in unique_identifiers:
+                unique_identifiers.append(identifier)
+        if len(unique_identifiers) >= 3:
+            break
     
     return unique_identifiers[:3]  # Return up to 3 identifiers
 
@@ -189,15 +227,7 @@ def group_documents_intelligently(pages: List[Dict]) -> List[Dict]:
     for page in pages:
         if current_group is None:
             # Start first group
-            current_group = {
-                'form_type': page['form_type'],
-                'document_type': page['document_type'],
-                'confidence': page['confidence'],
-                'pages': [page['page_number']],
-                'page_range': f"Page {page['page_number']}",
-                'extracted_text': page['extracted_text'],
-                'text_length': page['text_length']
-            }
+            current_group = start_document_group(page)
         else:
             # Check if this page should be grouped with current document
             should_group = should_group_pages(current_group, page)
@@ -205,7 +235,8 @@ def group_documents_intelligently(pages: List[Dict]) -> List[Dict]:
             if should_group:
                 # Add to current group
                 current_group['pages'].append(page['page_number'])
-                current_group['extracted_text'] += '\n\n--- Page {} ---\n'.format(page['page_number']) + page['extracted_text']
+                current_group['_parts'].append('\n\n--- Page {} ---\n'.format(page['page_number']))
+                current_group['_parts'].append(page['extracted_text'])
                 current_group['text_length'] += page['text_length']
                 current_group['confidence'] = max(current_group['confidence'], page['confidence'])
                 
@@ -214,23 +245,36 @@ def group_documents_intelligently(pages: List[Dict]) -> List[Dict]:
                     current_group['page_range'] = f"Pages {min(current_group['pages'])}-{max(current_group['pages'])}"
             else:
                 # Save current group and start new one
-                grouped_docs.append(current_group)
-                current_group = {
-                    'form_type': page['form_type'],
-                    'document_type': page['document_type'],
-                    'confidence': page['confidence'],
-                    'pages': [page['page_number']],
-                    'page_range': f"Page {page['page_number']}",
-                    'extracted_text': page['extracted_text'],
-                    'text_length': page['text_length']
-                }
+                grouped_docs.append(finish_document_group(current_group))
+                current_group = start_document_group(page)
     
     # Add the last group
     if current_group:
-        grouped_docs.append(current_group)
+        grouped_docs.append(finish_document_group(current_group))
     
     return grouped_docs
 
+def start_document_group(page: Dict) -> Dict:
+    """
+    Start a new document group from its first page; text is collected in '_parts'
+    """
+    return {
+        'form_type': page['form_type'],
+        'document_type': page['document_type'],
+        'confidence': page['confidence'],
+        'pages': [page['page_number']],
+        'page_range': f"Page {page['page_number']}",
+        '_parts': [page['extracted_text']],
+        'text_length': page['text_length']
+    }
+
+def finish_document_group(group: Dict) -> Dict:
+    """
+    Join the collected page text once when the group is complete
+    """
+    group['extracted_text'] = ''.join(group.pop('_parts'))
+    return group
+
 def should_group_pages(current_group: Dict, new_page: Dict) -> bool:
     """
     Determine if a new page should be grouped with the current document
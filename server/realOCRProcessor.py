@@ -7,114 +7,347 @@ Extracts actual text from uploaded documents using OCR and pattern matching
 import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-import io
 import json
+import logging
 import os
 import sys
-from typing import List, Dict, Any
+from bisect import bisect_right
+from typing import List, Dict, Any, Iterator
+from keywordClassifier import build_pattern_automaton, find_pattern_hits
+from ocrWorkers import OCR_WORKERS, create_ocr_api, map_ocr_requests
+from pdfSource import open_pdf
+
+# Silent unless the caller (or main) configures logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Render resolution for OCR; 144 dpi grayscale is plenty for typeset trade documents
+OCR_DPI = 144
+
+# Pages with more direct text than this are not OCRed
+MIN_NATIVE_CHARS = 100
+
+# Pages whose leading characters are mostly not letters are OCR noise (dividers, stamps, scan artefacts)
+NOISE_SAMPLE_CHARS = 200
+MIN_ALPHA_RATIO = 0.2
+
+# Without worker processes or tesserocr, pages are stacked into tiles up to this tall
+# so each tesseract subprocess reads several pages
+MAX_TILE_HEIGHT = 8000
+TILE_GAP = 40
+
+# Characters tesseract may emit for OCR'd pages
+OCR_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,:-/$%&()[]{}@#'
+OCR_CONFIG = f'--psm 6 -c tessedit_char_whitelist={OCR_WHITELIST}'
+# The same settings for in-process tesserocr engines
+OCR_API_SETTINGS = {'psm': 'SINGLE_BLOCK', 'oem': 'LSTM_ONLY',
+                    'variables': {'tessedit_char_whitelist': OCR_WHITELIST}}
+
+def is_ocr_noise(text: str) -> bool:
+    """
+    True if too few of the page's leading characters are letters to be worth classifying
+    """
+    sample = text[:NOISE_SAMPLE_CHARS]
+    return sum(c.isalpha() for c in sample) < MIN_ALPHA_RATIO * len(sample)
+
+def image_region(page):
+    """
+    Bounding box of all images drawn on the page (inline ones included), or None if it has none
+    """
+    region = fitz.Rect()
+    for image_info in page.get_image_info():
+        region |= fitz.Rect(image_info['bbox']) & page.rect
+    return None if region.is_empty else region
+
+def ocr_page(doc, page_num: int, clip: tuple = None, api=None) -> tuple:
+    """
+    OCR one page (or the clip area of it) of an open document, returning (page_num, text, error)
+    """
+    try:
+        # Convert page to high-resolution image
+        pix = doc[page_num].get_pixmap(dpi=OCR_DPI, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        
+        if api is not None:
+            # Hand the raw grayscale samples to the in-process engine
+            api.SetImageBytes(pix.samples, pix.width, pix.height, 1, pix.stride)
+            return page_num, api.GetUTF8Text(), None
+        
+        img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        pix = None  # Release the pixmap before OCR
+        
+        with img:
+            # Extract text using OCR with better config
+            return page_num, pytesseract.image_to_string(img, config=OCR_CONFIG), None
+    except Exception as ocr_error:
+        return page_num, '', str(ocr_error)
+    finally:
+        # Keep MuPDF's resource store from growing with every rendered page
+        fitz.TOOLS.store_shrink(100)
+
+def ocr_request_page(doc, ocr_request: tuple, api=None) -> tuple:
+    """
+    OCR one (page_num, clip) request; the worker pool's per-request entry point
+    """
+    page_num, clip = ocr_request
+    return ocr_page(doc, page_num, clip, api)
+
+def iter_ocr_pages(pdf_bytes: bytes, doc, ocr_requests: List[tuple]) -> Iterator[tuple]:
+    """
+    OCR the given (page_num, clip) regions, in parallel when there are several,
+    yielding (page_num, text, error) in order
+    """
+    if len(ocr_requests) > 1 and OCR_WORKERS > 1:
+        yield from map_ocr_requests(ocr_request_page, pdf_bytes, ocr_requests, OCR_API_SETTINGS)
+    elif ocr_requests:
+        api = create_ocr_api(**OCR_API_SETTINGS)
+        if api is None and len(ocr_requests) > 1:
+            yield from iter_tiled_ocr_pages(doc, ocr_requests)
+            return
+        try:
+            for page_num, clip in ocr_requests:
+                yield ocr_page(doc, page_num, clip, api)
+        finally:
+            if api is not None:
+                api.End()
+
+def iter_tiled_ocr_pages(doc, ocr_requests: List[tuple]) -> Iterator[tuple]:
+    """
+    OCR the given (page_num, clip) regions with pytesseract, several pages per call,
+    yielding (page_num, text, error) in order
+    """
+    tile, tile_height = [], 0
+    for page_num, clip in ocr_requests:
+        try:
+            pix = doc[page_num].get_pixmap(dpi=OCR_DPI, clip=clip, colorspace=fitz.csGRAY, alpha=False)
+            entry = (page_num, Image.frombytes("L", (pix.width, pix.height), pix.samples), None)
+            pix = None
+        except Exception as render_error:
+            entry = (page_num, None, str(render_error))
+        finally:
+            fitz.TOOLS.store_shrink(100)
+        
+        height = entry[1].height + TILE_GAP if entry[1] is not None else 0
+        if tile and tile_height + height > MAX_TILE_HEIGHT:
+            yield from ocr_tile(tile)
+            tile, tile_height = [], 0
+        tile.append(entry)
+        tile_height += height
+    
+    if tile:
+        yield from ocr_tile(tile)
+
+def ocr_tile(tile: List[tuple]) -> Iterator[tuple]:
+    """
+    Stack the rendered pages of a tile vertically, OCR them in one call and split the
+    recognised lines back into pages by their vertical position
+    """
+    images = [image for _, image, _ in tile if image is not None]
+    page_tops, page_texts = [], {}
+    if images:
+        canvas = Image.new("L", (max(image.width for image in images),
+                                 sum(image.height + TILE_GAP for image in images)), 255)
+        top = 0
+        for index, (_, image, _) in enumerate(tile):
+            if image is not None:
+                canvas.paste(image, (0, top))
+                page_tops.append((top, index))
+                top += image.height + TILE_GAP
+                image.close()
+        
+        try:
+            data = pytesseract.image_to_data(canvas, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+        except Exception as ocr_error:
+            data = None
+            for _, index in page_tops:
+                page_texts[index] = ocr_error
+        finally:
+            canvas.close()
+        
+        if data is not None:
+            # Group words into lines, then give each line to the page it starts on
+            lines = {}
+            starts = [top for top, _ in page_tops]
+            for word, word_top, block, paragraph, line in zip(data['text'], data['top'], data['block_num'],
+                                                              data['par_num'], data['line_num']):
+                if word.strip():
+                    key = (block, paragraph, line)
+                    if key not in lines:
+                        lines[key] = (page_tops[max(bisect_right(starts, word_top) - 1, 0)][1], [])
+                    lines[key][1].append(word)
+            
+            for _, index in page_tops:
+                page_texts[index] = []
+            for index, words in lines.values():
+                page_texts[index].append(' '.join(words))
+    
+    for index, (page_num, image, render_error) in enumerate(tile):
+        if image is None:
+            yield page_num, '', render_error
+        elif isinstance(page_texts[index], Exception):
+            yield page_num, '', str(page_texts[index])
+        else:
+            yield page_num, '\n'.join(page_texts[index]), None
+
+# LC constituent document types: keyword patterns, key identifying patterns and base confidence
+CONSTITUENT_DOCS = [
+    {
+        'name': 'Letter of Credit',
+        'patterns': ['letter of credit', 'documentary credit', 'issuing bank', 'beneficiary', 'applicant', 'expiry date', 'credit number'],
+        'key_patterns': ['letter of credit', 'documentary credit', 'issuing bank'],
+        'confidence': 0.85
+    },
+    {
+        'name': 'Commercial Invoice',
+        'patterns': ['commercial invoice', 'invoice no', 'seller', 'buyer', 'invoice date', 'total amount', 'description'],
+        'key_patterns': ['commercial invoice', 'invoice no'],
+        'confidence': 0.80
+    },
+    {
+        'name': 'Bill of Lading',
+        'patterns': ['bill of lading', 'shipper', 'consignee', 'vessel', 'port of loading', 'port of discharge', 'b/l no'],
+        'key_patterns': ['bill of lading', 'b/l no'],
+        'confidence': 0.80
+    },
+    {
+        'name': 'Certificate of Origin',
+        'patterns': ['certificate of origin', 'country of origin', 'exporter', 'importer', 'chamber of commerce', 'certificate no'],
+        'key_patterns': ['certificate of origin'],
+        'confidence': 0.75
+    },
+    {
+        'name': 'Packing List',
+        'patterns': ['packing list', 'gross weight', 'net weight', 'packages', 'dimensions', 'packing list no'],
+        'key_patterns': ['packing list'],
+        'confidence': 0.75
+    },
+    {
+        'name': 'Insurance Certificate',
+        'patterns': ['insurance certificate', 'marine insurance', 'policy no', 'insured amount', 'coverage', 'insurer'],
+        'key_patterns': ['insurance certificate', 'marine insurance'],
+        'confidence': 0.75
+    },
+    {
+        'name': 'Draft/Bill of Exchange',
+        'patterns': ['bill of exchange', 'draft', 'drawee', 'drawer', 'at sight', 'tenor', 'pay to the order'],
+        'key_patterns': ['bill of exchange', 'draft'],
+        'confidence': 0.70
+    }
+]
+
+# One automaton over every type's patterns, scanned once per page
+PATTERN_LISTS = [doc_info['patterns'] for doc_info in CONSTITUENT_DOCS]
+PATTERN_AUTOMATON = build_pattern_automaton(PATTERN_LISTS)
+
+# Key identifying patterns are a subset of each type's patterns, so the same scan finds them
+KEY_PATTERN_INDICES = [
+    {i for i, pattern in enumerate(doc_info['patterns']) if pattern in doc_info['key_patterns']}
+    for doc_info in CONSTITUENT_DOCS
+]
+
+# Highest score any type after position i can still reach (all patterns plus the key boost)
+REMAINING_MAX_CONFIDENCE = [
+    max((doc_info['confidence'] * 1.2 for doc_info in CONSTITUENT_DOCS[i + 1:]), default=0)
+    for i in range(len(CONSTITUENT_DOCS))
+]
 
 class RealOCRProcessor:
     def __init__(self):
-        self.constituent_docs = [
-            {
-                'name': 'Letter of Credit',
-                'patterns': ['letter of credit', 'documentary credit', 'issuing bank', 'beneficiary', 'applicant', 'expiry date', 'credit number'],
-                'confidence': 0.85
-            },
-            {
-                'name': 'Commercial Invoice',
-                'patterns': ['commercial invoice', 'invoice no', 'seller', 'buyer', 'invoice date', 'total amount', 'description'],
-                'confidence': 0.80
-            },
-            {
-                'name': 'Bill of Lading',
-                'patterns': ['bill of lading', 'shipper', 'consignee', 'vessel', 'port of loading', 'port of discharge', 'b/l no'],
-                'confidence': 0.80
-            },
-            {
-                'name': 'Certificate of Origin',
-                'patterns': ['certificate of origin', 'country of origin', 'exporter', 'importer', 'chamber of commerce', 'certificate no'],
-                'confidence': 0.75
-            },
-            {
-                'name': 'Packing List',
-                'patterns': ['packing list', 'gross weight', 'net weight', 'packages', 'dimensions', 'packing list no'],
-                'confidence': 0.75
-            },
-            {
-                'name': 'Insurance Certificate',
-                'patterns': ['insurance certificate', 'marine insurance', 'policy no', 'insured amount', 'coverage', 'insurer'],
-                'confidence': 0.75
-            },
-            {
-                'name': 'Draft/Bill of Exchange',
-                'patterns': ['bill of exchange', 'draft', 'drawee', 'drawer', 'at sight', 'tenor', 'pay to the order'],
-                'confidence': 0.70
-            }
-        ]
+        # Pattern tables and automata are built once per process at import
+        self.constituent_docs = CONSTITUENT_DOCS
+        self.pattern_lists = PATTERN_LISTS
+        self.pattern_automaton = PATTERN_AUTOMATON
+        self.key_pattern_indices = KEY_PATTERN_INDICES
+        self.remaining_max_confidence = REMAINING_MAX_CONFIDENCE
     
-    def extract_text_with_ocr(self, pdf_path: str) -> List[Dict[str, Any]]:
-        """Extract text from each page using OCR when needed"""
+    def iter_pages_text(self, pdf_path: str, pdf_bytes: bytes = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the text of each page in order, using OCR when needed. Yields nothing if the
+        PDF cannot be opened; an error partway through is logged and re-raised, so callers
+        never mistake a truncated document for a short one.
+        """
         try:
-            doc = fitz.open(pdf_path)
-            pages_text = []
-            
+            # Read the file once (unless the caller already has); OCR workers open their own copy from these bytes
+            doc, pdf_bytes = open_pdf(pdf_path, pdf_bytes)
+        except Exception as e:
+            logger.error("Error extracting text: %s", e)
+            return
+        
+        try:
+            # First try direct text extraction
+            direct_texts = []
+            ocr_regions = {}
             for page_num in range(doc.page_count):
                 page = doc[page_num]
+                direct_text = page.get_text("text").strip()
+                direct_texts.append(direct_text)
                 
-                # First try direct text extraction
-                direct_text = page.get_text()
-                
-                # If direct text is sufficient, use it
-                if len(direct_text.strip()) > 100:
-                    extracted_text = direct_text.strip()
+                # Pages with little text are OCRed over the area covered by their images
+                # (inline ones included), or whole when they have none, e.g. vector-drawn scans
+                if len(direct_text) <= MIN_NATIVE_CHARS:
+                    region = image_region(page) or page.rect
+                    ocr_regions[page_num] = (region, region != page.rect)
+            
+            # Use OCR for scanned pages; results arrive lazily, in page order
+            ocr_results = iter_ocr_pages(pdf_bytes, doc, [
+                (page_num, tuple(region)) for page_num, (region, _) in ocr_regions.items()
+            ])
+            
+            for page_num, direct_text in enumerate(direct_texts):
+                # If direct text is sufficient (or there is nothing to OCR), use it
+                if page_num not in ocr_regions:
+                    extracted_text = direct_text
                 else:
-                    # Use OCR for scanned pages
-                    try:
-                        # Convert page to high-resolution image
-                        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x scaling
-                        img_data = pix.tobytes("png")
-                        img = Image.open(io.BytesIO(img_data))
-                        
-                        # Extract text using OCR with better config
-                        ocr_text = pytesseract.image_to_string(
-                            img, 
-                            config='--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,:-/$%&()[]{}@#'
-                        )
+                    _, ocr_text, ocr_error = next(ocr_results)
+                    if ocr_error is not None:
+                        logger.warning("OCR failed for page %d: %s", page_num + 1, ocr_error)
+                        extracted_text = direct_text
+                    else:
                         extracted_text = ocr_text.strip()
                         
                         # If OCR didn't work well, combine with direct text
-                        if len(extracted_text) < 50 and len(direct_text.strip()) > 0:
-                            extracted_text = direct_text.strip()
-                            
-                    except Exception as ocr_error:
-                        print(f"OCR failed for page {page_num + 1}: {ocr_error}")
-                        extracted_text = direct_text.strip()
+                        if len(extracted_text) < 50 and len(direct_text) > 0:
+                            extracted_text = direct_text
+                        elif direct_text and ocr_regions[page_num][1]:
+                            # Only the images were OCRed, so keep the page's own text too
+                            extracted_text = f"{direct_text}\n{extracted_text}"
                 
-                pages_text.append({
+                yield {
                     'page_number': page_num + 1,
                     'text': extracted_text,
                     'text_length': len(extracted_text)
-                })
+                }
             
-            doc.close()
-            return pages_text
+            # Shut down the OCR engine or worker pool
+            ocr_results.close()
             
         except Exception as e:
-            print(f"Error extracting text: {e}")
+            logger.error("Error extracting text: %s", e)
+            raise
+        finally:
+            doc.close()
+    
+    def extract_text_with_ocr(self, pdf_path: str, pdf_bytes: bytes = None) -> List[Dict[str, Any]]:
+        """Extract text from each page using OCR when needed (empty if extraction fails)"""
+        try:
+            return list(self.iter_pages_text(pdf_path, pdf_bytes))
+        except Exception:
+            # Already logged by iter_pages_text; a partial page list would pass for a shorter document
             return []
     
-    def detect_document_type(self, text: str) -> Dict[str, Any]:
+    def detect_document_type(self, text: str, text_lower: str = None) -> Dict[str, Any]:
         """Detect document type from actual extracted text"""
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
         best_match = None
         best_confidence = 0
         best_patterns = []
         
-        for doc_info in self.constituent_docs:
+        hits = find_pattern_hits(self.pattern_automaton, self.pattern_lists, text_lower)
+        
+        for doc_index, doc_info in enumerate(self.constituent_docs):
             # Count pattern matches in the text
-            patterns_found = [pattern for pattern in doc_info['patterns'] if pattern in text_lower]
+            patterns_found = [doc_info['patterns'][i] for i in sorted(hits[doc_index])]
             matches = len(patterns_found)
             
             if matches > 0:
@@ -122,17 +355,7 @@ class RealOCRProcessor:
                 base_confidence = (matches / len(doc_info['patterns'])) * doc_info['confidence']
                 
                 # Boost confidence for key identifying patterns
-                key_patterns = {
-                    'Letter of Credit': ['letter of credit', 'documentary credit', 'issuing bank'],
-                    'Commercial Invoice': ['commercial invoice', 'invoice no'],
-                    'Bill of Lading': ['bill of lading', 'b/l no'],
-                    'Certificate of Origin': ['certificate of origin'],
-                    'Packing List': ['packing list'],
-                    'Insurance Certificate': ['insurance certificate', 'marine insurance'],
-                    'Draft/Bill of Exchange': ['bill of exchange', 'draft']
-                }
-                
-                key_found = any(key in text_lower for key in key_patterns.get(doc_info['name'], []))
+                key_found = not hits[doc_index].isdisjoint(self.key_pattern_indices[doc_index])
                 if key_found:
                     base_confidence *= 1.2
                 
@@ -140,6 +363,10 @@ class RealOCRProcessor:
                     best_match = doc_info['name']
                     best_confidence = base_confidence
                     best_patterns = patterns_found
+            
+            # Stop once no remaining type can beat the current best
+            if best_confidence >= self.remaining_max_confidence[doc_index]:
+                break
         
         if best_match:
             return {
@@ -160,33 +387,29 @@ class RealOCRProcessor:
         
         return None
     
-    def process_lc_document(self, file_path: str) -> Dict[str, Any]:
+    def process_lc_document(self, file_path: str, pdf_bytes: bytes = None) -> Dict[str, Any]:
         """Process LC document with real OCR extraction"""
         try:
-            # Extract text from all pages
-            pages_text = self.extract_text_with_ocr(file_path)
-            
-            if not pages_text:
-                return {
-                    'error': 'Failed to extract text from document',
-                    'detected_forms': [],
-                    'processing_method': 'Real OCR Text Extraction'
-                }
-            
             detected_forms = []
             processed_pages = []
+            total_pages = 0
+            pages_with_text = 0
             
-            # Analyze each page
-            for page_data in pages_text:
+            # Analyze each page as its text is extracted
+            for page_data in self.iter_pages_text(file_path, pdf_bytes):
                 page_num = page_data['page_number']
                 text = page_data['text']
+                text_length = len(text.strip())
+                total_pages += 1
+                if text_length > 20:
+                    pages_with_text += 1
                 
-                # Skip pages with very little text
-                if len(text.strip()) < 20:
+                # Skip pages with very little text, or text that is mostly OCR noise
+                if text_length < 20 or is_ocr_noise(text):
                     continue
                 
                 # Detect document type
-                detection = self.detect_document_type(text)
+                detection = self.detect_document_type(text, text.lower())
                 
                 if detection:
                     detected_forms.append({
@@ -202,16 +425,23 @@ class RealOCRProcessor:
                     
                     processed_pages.append(page_num)
             
+            if not total_pages:
+                return {
+                    'error': 'Failed to extract text from document',
+                    'detected_forms': [],
+                    'processing_method': 'Real OCR Text Extraction'
+                }
+            
             return {
-                'total_pages': len(pages_text),
+                'total_pages': total_pages,
                 'detected_forms': detected_forms,
                 'processing_method': 'Real OCR Text Extraction',
                 'processed_pages': processed_pages,
-                'pages_with_text': len([p for p in pages_text if len(p['text'].strip()) > 20])
+                'pages_with_text': pages_with_text
             }
             
         except Exception as e:
-            print(f"Error processing document: {e}")
+            logger.error("Error processing document: %s", e)
             return {
                 'error': str(e),
                 'detected_forms': [],
@@ -220,6 +450,8 @@ class RealOCRProcessor:
 
 def main():
     """Main function for command line usage"""
+    logging.basicConfig(level=logging.INFO)
+    
     if len(sys.argv) != 2:
         print("Usage: python realOCRProcessor.py <pdf_file_path>")
         sys.exit(1)
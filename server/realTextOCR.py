@@ -7,6 +7,19 @@ import fitz  # PyMuPDF
 import sys
 import json
 import os
+from keywordClassifier import build_pattern_automaton, find_pattern_hits
+
+# Document type keywords, scanned in a single pass by one automaton
+TYPE_PATTERNS = {
+    'Letter of Credit': ['letter of credit', 'documentary credit', 'issuing bank', 'beneficiary'],
+    'Commercial Invoice': ['commercial invoice', 'invoice no', 'seller', 'buyer'],
+    'Bill of Lading': ['bill of lading', 'shipper', 'consignee', 'vessel'],
+    'Certificate of Origin': ['certificate of origin', 'country of origin', 'chamber'],
+    'Packing List': ['packing list', 'gross weight', 'net weight'],
+    'Insurance Certificate': ['insurance certificate', 'marine insurance', 'policy']
+}
+TYPE_PATTERN_LISTS = list(TYPE_PATTERNS.values())
+TYPE_AUTOMATON = build_pattern_automaton(TYPE_PATTERN_LISTS)
 
 def extract_real_text(pdf_path: str):
     """Extract real text from PDF with proper error handling"""
@@ -22,20 +35,12 @@ def extract_real_text(pdf_path: str):
                     page = doc[page_num]
                     text = page.get_text()
                     
-                    # If direct text extraction has little content, try OCR
+                    # If direct text extraction has little content, retry in reading order
                     if len(text.strip()) < 50:
                         try:
-                            # Try to extract text using OCR methods
-                            text_dict = page.get_text("dict")
-                            blocks = text_dict.get("blocks", [])
-                            ocr_text = ""
-                            for block in blocks:
-                                if "lines" in block:
-                                    for line in block["lines"]:
-                                        for span in line.get("spans", []):
-                                            ocr_text += span.get("text", "") + " "
-                            if len(ocr_text.strip()) > len(text.strip()):
-                                text = ocr_text.strip()
+                            sorted_text = page.get_text("text", sort=True)
+                            if len(sorted_text.strip()) > len(text.strip()):
+                                text = sorted_text.strip()
                         except:
                             pass
                     
@@ -73,22 +78,13 @@ def extract_real_text(pdf_path: str):
 
 def detect_type_from_text(text):
     """Detect document type from actual text content"""
-    text_lower = text.lower()
-    
-    patterns = {
-        'Letter of Credit': ['letter of credit', 'documentary credit', 'issuing bank', 'beneficiary'],
-        'Commercial Invoice': ['commercial invoice', 'invoice no', 'seller', 'buyer'],
-        'Bill of Lading': ['bill of lading', 'shipper', 'consignee', 'vessel'],
-        'Certificate of Origin': ['certificate of origin', 'country of origin', 'chamber'],
-        'Packing List': ['packing list', 'gross weight', 'net weight'],
-        'Insurance Certificate': ['insurance certificate', 'marine insurance', 'policy']
-    }
+    hits = find_pattern_hits(TYPE_AUTOMATON, TYPE_PATTERN_LISTS, text.lower())
     
     best_match = 'Trade Finance Document'
     best_score = 0
     
-    for doc_type, keywords in patterns.items():
-        score = sum(1 for keyword in keywords if keyword in text_lower)
+    for doc_type, type_hits in zip(TYPE_PATTERNS, hits):
+        score = len(type_hits)
         if score > best_score:
             best_score = score
             best_match = doc_type
@@ -6,114 +6,201 @@ Performs actual OCR, form detection, and document splitting
 
 import sys
 import json
+import logging
 import os
-import io
 import fitz  # PyMuPDF
 import pytesseract
-from PIL import Image
-import cv2
 import numpy as np
 import re
 from datetime import datetime
 import tempfile
 import argparse
+from functools import partial
+from ocrWorkers import OCR_WORKERS, create_ocr_api, map_ocr_requests
+from pdfSource import open_pdf
+
+# Silent unless the caller (or main) configures logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Render resolution for OCR; 144 dpi grayscale is plenty for typeset trade documents
+OCR_DPI = 144
+
+# In-process tesserocr engine settings (uniform block of text, LSTM engine)
+OCR_API_SETTINGS = {'psm': 'SINGLE_BLOCK', 'oem': 'LSTM_ONLY'}
+
+def gaussian_blur_3x3(gray):
+    """3x3 Gaussian blur ([1, 2, 1] kernel, reflected borders) on a uint8 image"""
+    padded = np.pad(gray, 1, mode='reflect').astype(np.uint16)
+    rows = padded[:-2] + 2 * padded[1:-1] + padded[2:]
+    blurred = rows[:, :-2] + 2 * rows[:, 1:-1] + rows[:, 2:]
+    return ((blurred + 8) >> 4).astype(np.uint8)
+
+def otsu_threshold(gray):
+    """Binarize a uint8 image at the Otsu threshold (pixels above it become 255)"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_below = np.cumsum(hist)
+    weight_above = weight_below[-1] - weight_below
+    sum_below = np.cumsum(hist * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_below = sum_below / weight_below
+        mean_above = (sum_below[-1] - sum_below) / weight_above
+        between_class_variance = weight_below * weight_above * (mean_below - mean_above) ** 2
+    threshold = int(np.argmax(np.nan_to_num(between_class_variance)))
+    return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+# Regex patterns that identify each form type
+FORM_PATTERNS = {
+    'Commercial Invoice': [
+        r'commercial\s+invoice', r'invoice\s+number', r'seller', r'buyer', 
+        r'description\s+of\s+goods', r'quantity', r'unit\s+price', r'amount'
+    ],
+    'Bill of Lading': [
+        r'bill\s+of\s+lading', r'b/l\s+no', r'shipper', r'consignee', 
+        r'port\s+of\s+loading', r'port\s+of\s+discharge', r'vessel', r'freight'
+    ],
+    'Certificate of Origin': [
+        r'certificate\s+of\s+origin', r'country\s+of\s+origin', r'exporter',
+        r'importer', r'description\s+of\s+goods', r'harmonized\s+system'
+    ],
+    'Packing List': [
+        r'packing\s+list', r'package\s+no', r'description', r'quantity',
+        r'net\s+weight', r'gross\s+weight', r'dimensions'
+    ],
+    'Insurance Certificate': [
+        r'insurance\s+certificate', r'policy\s+no', r'insured\s+value',
+        r'risk\s+covered', r'premium', r'beneficiary'
+    ],
+    'Letter of Credit': [
+        r'letter\s+of\s+credit', r'documentary\s+credit', r'l/c\s+no',
+        r'applicant', r'beneficiary', r'amount', r'expiry\s+date'
+    ],
+    'Inspection Certificate': [
+        r'inspection\s+certificate', r'certificate\s+no', r'inspector',
+        r'inspection\s+date', r'result', r'conformity'
+    ],
+    'Bill of Exchange': [
+        r'bill\s+of\s+exchange', r'exchange\s+no', r'drawer', r'drawee',
+        r'payee', r'amount', r'maturity\s+date'
+    ],
+    'Multimodal Transport Document': [
+        r'multimodal\s+transport', r'combined\s+transport', r'mto\s+no',
+        r'place\s+of\s+receipt', r'place\s+of\s+delivery', r'container'
+    ]
+}
+
+# Key fields per document type: (field name, pattern capturing the value, value formatter)
+KEY_FIELD_PATTERNS = {
+    'Commercial Invoice': [
+        ('Invoice Number', r'invoice\s+no[.:\s]+([A-Z0-9-]+)', str.upper),
+        ('Total Amount', r'total\s+amount[:\s]+([0-9,]+\.?\d*)', str),
+    ],
+    'Bill of Lading': [
+        ('B/L Number', r'b/l\s+no[.:\s]+([A-Z0-9-]+)', str.upper),
+        ('Vessel Name', r'vessel[:\s]+([A-Z\s]+)', lambda value: value.strip().title()),
+    ],
+}
+
+# One alternation per document type; group f<i> wraps field i so a single pass finds every field
+KEY_FIELD_REGEXES = {
+    doc_type: re.compile('|'.join(f'(?P<f{i}>{pattern})' for i, (_, pattern, _) in enumerate(field_patterns)))
+    for doc_type, field_patterns in KEY_FIELD_PATTERNS.items()
+}
+
+# Patterns shared by several types (amount, beneficiary, ...) are compiled and searched once
+COMPILED_PATTERNS = {
+    pattern: re.compile(pattern)
+    for patterns in FORM_PATTERNS.values()
+    for pattern in patterns
+}
 
 class RealTimeOCRProcessor:
-    def __init__(self):
-        self.form_patterns = {
-            'Commercial Invoice': [
-                r'commercial\s+invoice', r'invoice\s+number', r'seller', r'buyer', 
-                r'description\s+of\s+goods', r'quantity', r'unit\s+price', r'amount'
-            ],
-            'Bill of Lading': [
-                r'bill\s+of\s+lading', r'b/l\s+no', r'shipper', r'consignee', 
-                r'port\s+of\s+loading', r'port\s+of\s+discharge', r'vessel', r'freight'
-            ],
-            'Certificate of Origin': [
-                r'certificate\s+of\s+origin', r'country\s+of\s+origin', r'exporter',
-                r'importer', r'description\s+of\s+goods', r'harmonized\s+system'
-            ],
-            'Packing List': [
-                r'packing\s+list', r'package\s+no', r'description', r'quantity',
-                r'net\s+weight', r'gross\s+weight', r'dimensions'
-            ],
-            'Insurance Certificate': [
-                r'insurance\s+certificate', r'policy\s+no', r'insured\s+value',
-                r'risk\s+covered', r'premium', r'beneficiary'
-            ],
-            'Letter of Credit': [
-                r'letter\s+of\s+credit', r'documentary\s+credit', r'l/c\s+no',
-                r'applicant', r'beneficiary', r'amount', r'expiry\s+date'
-            ],
-            'Inspection Certificate': [
-                r'inspection\s+certificate', r'certificate\s+no', r'inspector',
-                r'inspection\s+date', r'result', r'conformity'
-            ],
-            'Bill of Exchange': [
-                r'bill\s+of\s+exchange', r'exchange\s+no', r'drawer', r'drawee',
-                r'payee', r'amount', r'maturity\s+date'
-            ],
-            'Multimodal Transport Document': [
-                r'multimodal\s+transport', r'combined\s+transport', r'mto\s+no',
-                r'place\s+of\s+receipt', r'place\s+of\s+delivery', r'container'
-            ]
-        }
+    def __init__(self, photographed=False):
+        # Photographed documents get the (much slower) non-local means denoising
+        self.photographed = photographed
+        # Pattern tables and automata are built once per process at import
+        self.form_patterns = FORM_PATTERNS
+        self.key_field_patterns = KEY_FIELD_PATTERNS
+        self.key_field_regexes = KEY_FIELD_REGEXES
+        self.compiled_patterns = COMPILED_PATTERNS
     
     def preprocess_image(self, image):
         """Preprocess image for better OCR results"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # OpenCV is only loaded for colour input and photographed documents
+        if image.ndim == 3 or self.photographed:
+            import cv2
         
-        # Apply denoising
-        denoised = cv2.fastNlMeansDenoising(gray)
+        # Convert to grayscale (pages are already rendered in grayscale)
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Apply binary threshold
-        _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Apply denoising: a light blur is enough for scanned or rendered pages
+        if self.photographed:
+            denoised = cv2.fastNlMeansDenoising(gray)
+        else:
+            denoised = gaussian_blur_3x3(gray)
         
-        return binary
+        # Apply binary threshold
+        return otsu_threshold(denoised)
     
     def extract_text_from_page(self, page):
         """Extract text from a PDF page using OCR"""
+        # First try to extract text directly from PDF
+        direct_text = page.get_text()
+        if direct_text.strip():
+            return direct_text.strip()
+        
+        # If no direct text, OCR the area covered by the page's images (the whole page if it has none)
+        return self.ocr_page(page, self.image_region(page) or page.rect)
+    
+    def image_region(self, page):
+        """Bounding box of all images drawn on the page, inline ones included, or None if it has no visible images"""
+        region = fitz.Rect()
+        for image_info in page.get_image_info():
+            region |= fitz.Rect(image_info['bbox']) & page.rect
+        return None if region.is_empty else region
+    
+    def ocr_page(self, page, clip=None, api=None):
+        """OCR a PDF page (or the clip area of it) that has no text layer"""
         try:
-            # First try to extract text directly from PDF
-            direct_text = page.get_text()
-            if direct_text.strip():
-                return direct_text.strip()
-            
-            # If no direct text, use OCR
             # Convert page to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better quality
-            img_data = pix.tobytes("png")
-            
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(img_data))
+            pix = page.get_pixmap(dpi=OCR_DPI, clip=clip, colorspace=fitz.csGRAY, alpha=False)
             
-            # Convert to OpenCV format
-            opencv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+            # View the raw grayscale samples as an OpenCV image, no PNG round-trip
+            gray_image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
             
-            # Preprocess for better OCR
-            processed_image = self.preprocess_image(opencv_image)
+            # Preprocess for better OCR; only the binarized page stays alive during OCR
+            processed_image = self.preprocess_image(gray_image)
+            gray_image = pix = None
             
-            # Perform OCR
-            text = pytesseract.image_to_string(processed_image, config='--psm 6')
+            # Perform OCR, in-process when a tesserocr engine is available
+            if api is not None:
+                height, width = processed_image.shape
+                api.SetImageBytes(processed_image.tobytes(), width, height, 1, width)
+                text = api.GetUTF8Text()
+            else:
+                text = pytesseract.image_to_string(processed_image, config='--psm 6')
             
             return text.strip()
         except Exception as e:
-            print(f"Error extracting text from page: {e}", file=sys.stderr)
+            logger.warning("Error extracting text from page: %s", e)
             return ""
+        finally:
+            # Keep MuPDF's resource store from growing with every rendered page
+            fitz.TOOLS.store_shrink(100)
     
-    def classify_document_type(self, text):
+    def classify_document_type(self, text, text_lower=None):
         """Classify document type based on extracted text"""
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
+        
+        found = {pattern for pattern, regex in self.compiled_patterns.items() if regex.search(text_lower)}
         
         best_match = 'Trade Finance Document'
         best_score = 0
         
         for doc_type, patterns in self.form_patterns.items():
-            score = 0
-            for pattern in patterns:
-                if re.search(pattern, text_lower):
-                    score += 1
+            score = sum(1 for pattern in patterns if pattern in found)
             
             # Calculate confidence as percentage
             confidence = (score / len(patterns)) * 100
@@ -125,32 +212,23 @@ class RealTimeOCRProcessor:
         
         return best_match, max(best_score, 50)  # Minimum 50% confidence
     
-    def extract_key_fields(self, text, doc_type):
+    def extract_key_fields(self, text, doc_type, text_lower=None):
         """Extract key fields based on document type"""
         fields = {}
-        text_lower = text.lower()
-        
-        if doc_type == 'Commercial Invoice':
-            # Extract invoice number
-            invoice_match = re.search(r'invoice\s+no[.:\s]+([A-Z0-9-]+)', text_lower)
-            if invoice_match:
-                fields['Invoice Number'] = invoice_match.group(1).upper()
-            
-            # Extract amount
-            amount_match = re.search(r'total\s+amount[:\s]+([0-9,]+\.?\d*)', text_lower)
-            if amount_match:
-                fields['Total Amount'] = amount_match.group(1)
+        if text_lower is None:
+            text_lower = text.lower()
         
-        elif doc_type == 'Bill of Lading':
-            # Extract B/L number
-            bl_match = re.search(r'b/l\s+no[.:\s]+([A-Z0-9-]+)', text_lower)
-            if bl_match:
-                fields['B/L Number'] = bl_match.group(1).upper()
+        field_regex = self.key_field_regexes.get(doc_type)
+        if field_regex is not None:
+            # Keep the first occurrence of each field
+            first_values = {}
+            for match in field_regex.finditer(text_lower):
+                first_values.setdefault(match.lastgroup, match.group(match.lastindex + 1))
             
-            # Extract vessel name
-            vessel_match = re.search(r'vessel[:\s]+([A-Z\s]+)', text_lower)
-            if vessel_match:
-                fields['Vessel Name'] = vessel_match.group(1).strip().title()
+            # Report fields in their declared order
+            for i, (field_name, _, format_value) in enumerate(self.key_field_patterns[doc_type]):
+                if f'f{i}' in first_values:
+                    fields[field_name] = format_value(first_values[f'f{i}'])
         
         # Add extracted text as a field
         fields['Full Extracted Text'] = text
@@ -159,10 +237,29 @@ class RealTimeOCRProcessor:
         
         return fields
     
-    def process_document(self, file_path):
+    def ocr_pages(self, pdf_bytes, doc, ocr_regions):
+        """OCR the given page regions, in parallel when there are several, returning page_num -> text"""
+        ocr_requests = [(page_num, tuple(region)) for page_num, region in ocr_regions.items()]
+        if len(ocr_requests) > 1 and OCR_WORKERS > 1:
+            ocr_request_func = partial(ocr_request_page, self.photographed)
+            return dict(zip(ocr_regions, map_ocr_requests(ocr_request_func, pdf_bytes,
+                                                          ocr_requests, OCR_API_SETTINGS)))
+        
+        if not ocr_requests:
+            return {}
+        
+        api = create_ocr_api(**OCR_API_SETTINGS)
+        try:
+            return {page_num: self.ocr_page(doc[page_num], clip, api) for page_num, clip in ocr_requests}
+        finally:
+            if api is not None:
+                api.End()
+    
+    def process_document(self, file_path, pdf_bytes=None):
         """Process a single document file"""
         try:
-            doc = fitz.open(file_path)
+            # Read the file once (unless the caller already has); OCR workers open their own copy from these bytes
+            doc, pdf_bytes = open_pdf(file_path, pdf_bytes)
             results = {
                 'status': 'success',
                 'total_pages': len(doc),
@@ -171,19 +268,29 @@ class RealTimeOCRProcessor:
                 'file_path': file_path
             }
             
-            # Process each page
+            # Extract text directly from each page, then OCR the image areas of pages without a text layer
+            page_texts = []
+            ocr_regions = {}
             for page_num in range(len(doc)):
                 page = doc[page_num]
-                
-                # Extract text from page
-                extracted_text = self.extract_text_from_page(page)
+                page_texts.append(page.get_text("text").strip())
+                if not page_texts[page_num]:
+                    ocr_regions[page_num] = self.image_region(page) or page.rect
+            ocr_texts = self.ocr_pages(pdf_bytes, doc, ocr_regions)
+            
+            # Process each page
+            for page_num in range(len(doc)):
+                extracted_text = page_texts[page_num] or ocr_texts.get(page_num, "")
                 
                 if extracted_text:
+                    # Lowercase once for both the classifier and the field extractor
+                    text_lower = extracted_text.lower()
+                    
                     # Classify document type
-                    doc_type, confidence = self.classify_document_type(extracted_text)
+                    doc_type, confidence = self.classify_document_type(extracted_text, text_lower)
                     
                     # Extract key fields
-                    key_fields = self.extract_key_fields(extracted_text, doc_type)
+                    key_fields = self.extract_key_fields(extracted_text, doc_type, text_lower)
                     
                     # Create form result
                     form_data = {
@@ -229,10 +336,19 @@ class RealTimeOCRProcessor:
                 'detected_forms': []
             }
 
+def ocr_request_page(photographed, doc, ocr_request, api=None):
+    """Worker pool entry point: OCR one (page_num, clip) request"""
+    page_num, clip = ocr_request
+    return RealTimeOCRProcessor(photographed).ocr_page(doc[page_num], clip, api)
+
 def main():
+    logging.basicConfig(level=logging.INFO)
+    
     parser = argparse.ArgumentParser(description='Process document with OCR')
     parser.add_argument('file_path', help='Path to the document file')
     parser.add_argument('--output', help='Output file path', default=None)
+    parser.add_argument('--photographed', action='store_true',
+                        help='Denoise pages as camera photos (slower)')
     
     args = parser.parse_args()
     
@@ -240,7 +356,7 @@ def main():
         print(json.dumps({'error': f'File not found: {args.file_path}'}))
         sys.exit(1)
     
-    processor = RealTimeOCRProcessor()
+    processor = RealTimeOCRProcessor(args.photographed)
     results = processor.process_document(args.file_path)
     
     # Output results as JSON
@@ -4,51 +4,96 @@ Robust OCR Extractor - Simple, reliable text extraction
 """
 
 import sys
+import os
 import json
 import fitz
-import cv2
-import numpy as np
-import pytesseract
-from PIL import Image
 import re
-from typing import List, Dict, Any
+import tempfile
+import hashlib
+from typing import List, Dict, Any, Optional
+from keywordClassifier import build_pattern_automaton, find_pattern_hits
+from ocrWorkers import OCR_WORKERS, create_ocr_api, map_ocr_requests
+from pdfSource import open_pdf
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optimized OCR configuration with character constraints: LSTM engine only (no legacy
+# model load) and psm 4, a single column of text in varying sizes, which keeps invoice
+# headings and line items apart. Deployments should point TESSDATA_PREFIX at the
+# tessdata_fast models (eng.traineddata), which are quicker than tessdata_best.
+OCR_BLACKLIST = '|~`^'
+OCR_CONFIG = f'--oem 1 --psm 4 -c tessedit_char_blacklist={OCR_BLACKLIST}'
+# The same settings for in-process tesserocr engines
+OCR_API_SETTINGS = {'psm': 'SINGLE_COLUMN', 'oem': 'LSTM_ONLY',
+                    'variables': {'tessedit_char_blacklist': OCR_BLACKLIST}}
+
+# OCR render zoom (1.5x = 108 dpi), lowered to the native resolution of a page's images
+# since rendering past it only interpolates, but never below 1x
+OCR_ZOOM = 1.5
+MIN_OCR_ZOOM = 1.0
+
+# Pages whose text layer has more than this many characters are taken as born-digital
+# and never rendered or OCRed
+MIN_DIRECT_TEXT_CHARS = 50
+
+# OpenCV, NumPy, PIL and pytesseract are only needed once a page has to be OCRed, so they
+# are imported by load_ocr_libraries; born-digital PDFs and usage errors never load them
+cv2 = np = pytesseract = Image = None
+
+def load_ocr_libraries():
+    """
+    Import the OCR image libraries on first use
+    """
+    global cv2, np, pytesseract, Image
+    if cv2 is not None:
+        return
+    import numpy as np
+    import pytesseract
+    from PIL import Image
+    import cv2
+    # Make sure OpenCV's SIMD kernels are in use; its thread count is left at the
+    # default (all cores) for the serial path and pinned to 1 inside OCR workers
+    cv2.setUseOptimized(True)
 
 def extract_documents_robustly(pdf_path: str) -> Dict[str, Any]:
     """
     Extract documents with robust OCR processing
     """
     try:
-        doc = fitz.open(pdf_path)
-        total_pages = doc.page_count
-        documents = []
-        
-        print(f"Robust OCR processing {total_pages} pages...", file=sys.stderr)
-        
-        # Process each page with simple, reliable OCR
-        for page_num in range(total_pages):
-            page = doc[page_num]
-            page_text = extract_page_text_robust(page, page_num + 1)
+        doc, pdf_bytes = open_pdf(pdf_path)
+        with doc:
+            total_pages = doc.page_count
+            documents = []
             
-            if page_text and len(page_text.strip()) > 10:
-                doc_type = classify_document_simple(page_text)
-                
-                document = {
-                    'form_type': f"{doc_type} - Page {page_num + 1}",
-                    'document_type': doc_type,
-                    'confidence': 0.8,
-                    'pages': [page_num + 1],
-                    'page_range': f"Page {page_num + 1}",
-                    'extracted_text': page_text,
-                    'text_length': len(page_text)
-                }
-                documents.append(document)
-                
-                print(f"Page {page_num + 1}: {doc_type} - {len(page_text)} chars", file=sys.stderr)
-        
-        # Group consecutive pages of same document type
-        grouped_docs = group_documents_simple(documents)
-        
-        doc.close()
+            print(f"Robust OCR processing {total_pages} pages...", file=sys.stderr)
+            
+            # Take direct text where the page has it; collect the rest for OCR
+            page_texts = [extract_direct_text(doc[page_num]) for page_num in range(total_pages)]
+            ocr_pages = [page_num for page_num, text in enumerate(page_texts) if text is None]
+            for page_num, text in zip(ocr_pages, ocr_pages_robust(pdf_bytes, doc, ocr_pages)):
+                page_texts[page_num] = text
+            
+            for page_num, page_text in enumerate(page_texts):
+                if page_text and len(page_text.strip()) > 10:
+                    doc_type = classify_document_simple(page_text)
+                    
+                    document = {
+                        'form_type': f"{doc_type} - Page {page_num + 1}",
+                        'document_type': doc_type,
+                        'confidence': 0.8,
+                        'pages': [page_num + 1],
+                        'page_range': f"Page {page_num + 1}",
+                        'extracted_text': page_text,
+                        'text_length': len(page_text)
+                    }
+                    documents.append(document)
+                    
+                    print(f"Page {page_num + 1}: {doc_type} - {len(page_text)} chars", file=sys.stderr)
+            
+            # Group consecutive pages of same document type
+            grouped_docs = group_documents_simple(documents)
         
         return {
             'total_pages': total_pages,
@@ -64,53 +109,277 @@ def extract_documents_robustly(pdf_path: str) -> Dict[str, Any]:
             'processing_method': 'Robust OCR Extraction'
         }
 
+def ocr_pages_robust(pdf_bytes: bytes, doc, page_nums: List[int]) -> List[str]:
+    """
+    OCR the given 0-based pages, in parallel worker processes when there are several
+    (or in one batched tesseract run when only one worker and no tesserocr is available)
+    """
+    if not page_nums:
+        return []
+    load_ocr_libraries()
+    if len(page_nums) > 1 and OCR_WORKERS > 1:
+        return list(map_ocr_requests(ocr_request_page, pdf_bytes, page_nums, OCR_API_SETTINGS,
+                                     setup=setup_ocr_worker, chunked=True))
+    api = create_ocr_api(**OCR_API_SETTINGS)
+    if api is None and len(page_nums) > 1:
+        return ocr_pages_batched(doc, page_nums)
+    try:
+        return [ocr_page_text(doc[page_num], page_num + 1, api) for page_num in page_nums]
+    finally:
+        if api is not None:
+            api.End()
+
+def setup_ocr_worker() -> None:
+    """
+    Worker setup: load the OCR libraries and keep OpenCV single-threaded, as pages are
+    already spread across processes
+    """
+    load_ocr_libraries()
+    cv2.setNumThreads(1)
+
+def ocr_request_page(doc, page_num: int, api=None) -> str:
+    """
+    Worker pool entry point: OCR one 0-based page
+    """
+    return ocr_page_text(doc[page_num], page_num + 1, api)
+
 def extract_page_text_robust(page, page_num: int) -> str:
     """
     Extract text with simple, robust OCR
     """
+    direct_text = extract_direct_text(page)
+    if direct_text is not None:
+        return direct_text
+    load_ocr_libraries()
+    return ocr_page_text(page, page_num)
+
+def extract_direct_text(page) -> Optional[str]:
+    """
+    Formatted direct text of the page, or None if it has too little to skip OCR
+    """
     try:
-        # First try direct text extraction
         direct_text = page.get_text()
-        if len(direct_text.strip()) > 50:
+        if len(direct_text.strip()) > MIN_DIRECT_TEXT_CHARS:
             return format_text_simple(direct_text)
         
-        # Use OCR for scanned content with simple settings
-        pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-        img_data = pix.tobytes("png")
-        
-        # Convert to numpy array
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Enhanced preprocessing for better OCR
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Denoise the image
-        denoised = cv2.fastNlMeansDenoising(gray)
-        
-        # Apply morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
-        cleaned = cv2.morphologyEx(denoised, cv2.MORPH_CLOSE, kernel)
-        
-        # Use adaptive thresholding for better character separation
-        thresh = cv2.adaptiveThreshold(cleaned, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        
-        # Convert back to PIL Image
-        pil_img = Image.fromarray(thresh)
-        
-        # Optimized OCR configuration with character constraints
-        custom_config = '--oem 3 --psm 6 -c tessedit_char_blacklist=|~`^'
-        extracted_text = pytesseract.image_to_string(pil_img, config=custom_config, lang='eng')
-        
-        # Apply aggressive text cleaning immediately after OCR
-        extracted_text = clean_garbled_text(extracted_text)
+        # With no images or vector graphics there is nothing on the page for OCR to read
+        # beyond its text layer (blank separator pages, short text-only pages)
+        if not page.get_image_info() and not page.get_cdrawings():
+            return format_text_simple(direct_text)
+    except Exception as e:
+        print(f"Error reading text of page {page.number + 1}: {str(e)}", file=sys.stderr)
+    return None
+
+def ocr_page_text(page, page_num: int, api=None) -> str:
+    """
+    OCR one page (page_num is 1-based, for messages), in-process when a tesserocr engine is given
+    """
+    try:
+        pix = render_ocr_pixmap(page)
+        image_key = page_image_key(pix)
+        cached_text = _ocr_text_cache.get(image_key)
+        if cached_text is not None:
+            return cached_text
         
-        return format_text_simple(extracted_text)
+        pil_img = preprocess_pixmap(pix)
+        if api is not None:
+            api.SetImage(pil_img)
+            extracted_text = api.GetUTF8Text()
+        else:
+            extracted_text = pytesseract.image_to_string(pil_img, config=OCR_CONFIG, lang='eng')
+        return remember_ocr_text(image_key, format_ocr_text(extracted_text))
         
     except Exception as e:
-        print(f"Error processing page {page_num}: {str(e)}", file=sys.stderr)
-        # Return a meaningful message instead of empty
-        return f"Page {page_num} contains scanned content that requires OCR processing. Text extraction attempted but may need manual review for optimal results."
+        return ocr_failure_text(page_num, e)
+
+def ocr_pages_batched(doc, page_nums: List[int]) -> List[str]:
+    """
+    OCR the given 0-based pages with a single tesseract run over an image list file,
+    so the engine and language data are loaded once instead of once per page
+    """
+    texts = [None] * len(page_nums)
+    try:
+        with tempfile.TemporaryDirectory(prefix='robust_ocr_') as tmp_dir:
+            # (index, image path, image key) of each distinct page image to OCR;
+            # repeats of an image already in the batch are filled in afterwards
+            batch = []
+            batch_keys = set()
+            repeats = []
+            for index, page_num in enumerate(page_nums):
+                try:
+                    pix = render_ocr_pixmap(doc[page_num])
+                    image_key = page_image_key(pix)
+                    if image_key in _ocr_text_cache:
+                        texts[index] = _ocr_text_cache[image_key]
+                    elif image_key in batch_keys:
+                        repeats.append((index, image_key))
+                    else:
+                        image_path = os.path.join(tmp_dir, f"page_{page_num + 1}.png")
+                        preprocess_pixmap(pix).save(image_path)
+                        batch.append((index, image_path, image_key))
+                        batch_keys.add(image_key)
+                except Exception as e:
+                    texts[index] = ocr_failure_text(page_num + 1, e)
+            
+            if batch:
+                list_path = os.path.join(tmp_dir, 'pages.txt')
+                with open(list_path, 'w') as f:
+                    f.write('\n'.join(image_path for _, image_path, _ in batch) + '\n')
+                
+                # Tesseract ends every page of a multi-image run with a form feed
+                page_outputs = pytesseract.image_to_string(list_path, config=OCR_CONFIG, lang='eng').split('\x0c')
+                if len(page_outputs) < len(batch):
+                    raise RuntimeError(f"expected {len(batch)} pages from tesseract, got {len(page_outputs)}")
+                batch_texts = {}
+                for (index, _, image_key), extracted_text in zip(batch, page_outputs):
+                    texts[index] = batch_texts[image_key] = remember_ocr_text(image_key, format_ocr_text(extracted_text))
+                for index, image_key in repeats:
+                    texts[index] = batch_texts[image_key]
+    except Exception as e:
+        return [text if text is not None else ocr_failure_text(page_num + 1, e)
+                for page_num, text in zip(page_nums, texts)]
+    
+    return texts
+
+# Formatted OCR text of recently seen page images, keyed by a hash of the rendered pixels,
+# so repeated pages (blank separators, boilerplate, identical continuation pages) are OCRed once
+OCR_TEXT_CACHE_SIZE = 256
+_ocr_text_cache = {}
+
+def page_image_key(pix) -> bytes:
+    """
+    Hash of a rendered page's pixels
+    """
+    return hashlib.blake2b(pix.samples, digest_size=16).digest()
+
+def remember_ocr_text(image_key: bytes, text: str) -> str:
+    """
+    Cache a page image's OCR text, dropping the oldest entry when full, and return the text
+    """
+    if len(_ocr_text_cache) >= OCR_TEXT_CACHE_SIZE:
+        _ocr_text_cache.pop(next(iter(_ocr_text_cache)))
+    _ocr_text_cache[image_key] = text
+    return text
+
+# Skewed scans are straightened when their estimated skew exceeds MIN_DESKEW_ANGLE degrees
+# (smaller tilts do not trouble tesseract). Angles up to MAX_DESKEW_ANGLE either way are tried
+# on the thresholded page shrunk by DESKEW_PROBE_SCALE, in coarse then fine steps.
+MIN_DESKEW_ANGLE = 0.5
+MAX_DESKEW_ANGLE = 10.0
+DESKEW_PROBE_SCALE = 0.25
+DESKEW_COARSE_STEP = 1.0
+DESKEW_FINE_STEP = 0.25
+
+# Preprocessing output buffers, reused from page to page while the page size stays the same
+_scratch_buffers = None
+
+def scratch_buffers(shape: tuple) -> tuple:
+    """
+    (denoised, thresh) buffers for a page of the given shape, reallocated only when it changes
+    """
+    global _scratch_buffers
+    if _scratch_buffers is None or _scratch_buffers[0].shape != shape:
+        _scratch_buffers = tuple(np.empty(shape, dtype=np.uint8) for _ in range(2))
+    return _scratch_buffers
+
+def ocr_zoom(page) -> float:
+    """
+    Render zoom for OCR: OCR_ZOOM, or less if the page's highest-resolution image is coarser than that
+    """
+    native_zoom = 0.0
+    for image_info in page.get_image_info():
+        bbox = fitz.Rect(image_info['bbox'])
+        if bbox.width > 0 and bbox.height > 0:
+            # Image pixels per PDF point along each axis
+            native_zoom = max(native_zoom, image_info['width'] / bbox.width, image_info['height'] / bbox.height)
+    
+    if native_zoom <= 0:
+        return OCR_ZOOM
+    return min(OCR_ZOOM, max(native_zoom, MIN_OCR_ZOOM))
+
+def render_ocr_pixmap(page):
+    """
+    Render a page for OCR
+    """
+    # Use OCR for scanned content with simple settings, rendered straight to 1-byte grayscale
+    zoom = ocr_zoom(page)
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+
+def row_profile_score(ink, angle: float) -> float:
+    """
+    How sharply the ink mask, rotated by angle degrees, separates into rows: text lines that
+    run level put all their ink into a few rows, so the sum of squared row totals peaks
+    """
+    height, width = ink.shape
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    rotated = cv2.warpAffine(ink, rotation, (width, height), flags=cv2.INTER_NEAREST)
+    rows = cv2.reduce(rotated, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32F).ravel()
+    return float(np.dot(rows, rows))
+
+def skew_angle(binary) -> float:
+    """
+    Rotation in degrees that levels the text lines of a thresholded page (0.0 for a page
+    without ink). Unlike a bounding rectangle around the ink, the row profile is not
+    thrown off by ragged line ends or indented lists.
+    """
+    probe = cv2.resize(binary, None, fx=DESKEW_PROBE_SCALE, fy=DESKEW_PROBE_SCALE, interpolation=cv2.INTER_AREA)
+    ink = cv2.compare(probe, 128, cv2.CMP_LT)
+    if not cv2.countNonZero(ink):
+        return 0.0
+    
+    coarse_angles = np.arange(-MAX_DESKEW_ANGLE, MAX_DESKEW_ANGLE + DESKEW_COARSE_STEP / 2, DESKEW_COARSE_STEP)
+    coarse = max(coarse_angles, key=lambda angle: row_profile_score(ink, angle))
+    fine_angles = np.arange(coarse - DESKEW_COARSE_STEP + DESKEW_FINE_STEP, coarse + DESKEW_COARSE_STEP, DESKEW_FINE_STEP)
+    return float(max(fine_angles, key=lambda angle: row_profile_score(ink, angle)))
+
+def preprocess_pixmap(pix) -> 'Image.Image':
+    """
+    Clean up a rendered page for OCR. The image shares this process's scratch
+    buffer, so it must be used before the next page is preprocessed.
+    """
+    # View the samples as a numpy array directly, without a PNG round-trip
+    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    denoised, thresh = scratch_buffers(gray.shape)
+    
+    # Denoise the image; a light blur is enough ahead of adaptive thresholding and far
+    # cheaper than non-local means, which searched a 21x21 window around every pixel
+    cv2.GaussianBlur(gray, (3, 3), 0, dst=denoised)
+    
+    # Use adaptive thresholding for better character separation; local thresholds keep
+    # text on shaded or unevenly lit scans that a single global cut (fixed or Otsu) loses
+    cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2, thresh)
+    
+    # Straighten skewed scans (into the now free denoise buffer); level pages are left alone
+    angle = skew_angle(thresh)
+    if abs(angle) > MIN_DESKEW_ANGLE:
+        height, width = thresh.shape
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cv2.warpAffine(thresh, rotation, (width, height), denoised, flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+        thresh = denoised
+    
+    # Convert back to PIL Image
+    return Image.fromarray(thresh)
+
+def format_ocr_text(extracted_text: str) -> str:
+    """
+    Clean and format raw tesseract output for one page
+    """
+    # Apply aggressive text cleaning immediately after OCR
+    extracted_text = clean_garbled_text(extracted_text)
+    
+    # Fix common OCR issues; direct PDF text skips these so clean text is not rewritten
+    extracted_text = fix_ocr_errors(extracted_text)
+    
+    return format_text_simple(extracted_text)
+
+def ocr_failure_text(page_num: int, error: Exception) -> str:
+    """
+    Log an OCR failure and return the placeholder text for the page
+    """
+    print(f"Error processing page {page_num}: {str(error)}", file=sys.stderr)
+    # Return a meaningful message instead of empty
+    return f"Page {page_num} contains scanned content that requires OCR processing. Text extraction attempted but may need manual review for optimal results."
 
 def format_text_simple(raw_text: str) -> str:
     """
@@ -122,34 +391,18 @@ def format_text_simple(raw_text: str) -> str:
     # Clean up the raw text
     text = raw_text.strip()
     
-    # Fix common OCR issues first
-    text = fix_ocr_errors(text)
-    
     # Split into meaningful paragraphs
     lines = text.split('\n')
     formatted_lines = []
     
     for line in lines:
-        line = line.strip()
-        if line and len(line) > 2:  # Skip very short lines
-            # Clean spacing and formatting
-            line = ' '.join(line.split())
-            
+        # Clean spacing and formatting; the words are split out once and reused for wrapping
+        words = line.split()
+        line = ' '.join(words)
+        if len(line) > 2:  # Skip very short lines
             # Split long lines for readability
             if len(line) > 100:
-                words = line.split()
-                current_line = ""
-                
-                for word in words:
-                    if len(current_line + " " + word) <= 80:
-                        current_line += (" " + word if current_line else word)
-                    else:
-                        if current_line:
-                            formatted_lines.append(current_line)
-                        current_line = word
-                
-                if current_line:
-                    formatted_lines.append(current_line)
+                formatted_lines.extend(wrap_words(words, 80))
             else:
                 formatted_lines.append(line)
     
@@ -161,140 +414,208 @@ def format_text_simple(raw_text: str) -> str:
     
     return formatted
 
+def compile_fixes(fixes) -> tuple:
+    """
+    Compile (pattern, replacement) pairs once at import
+    """
+    return tuple((re.compile(pattern), replacement) for pattern, replacement in fixes)
+
+# A run of spaced single capitals ("B A N K"); the last may be followed by punctuation
+SPACED_CAPS_PATTERN = r'\b[A-Z](?:\s+[A-Z])+\b'
+SPACING = re.compile(r'(\s+)')
+
+def spaced_caps_joiner(max_letters: int):
+    """
+    Replacement for SPACED_CAPS_PATTERN that joins a run into words of max_letters capitals,
+    left to right, with any shorter remainder joined into one last word. This is what
+    cascaded max_letters-, ..., 3- and 2-letter substitutions produced, in one scan.
+    """
+    def join_run(match) -> str:
+        parts = SPACING.split(match.group())
+        letters, gaps = parts[0::2], parts[1::2]
+        return ''.join(
+            (gaps[start - 1] if start else '') + ''.join(letters[start:start + max_letters])
+            for start in range(0, len(letters), max_letters)
+        )
+    return join_run
+
+def compile_fix_gate(fixes):
+    """
+    One alternation that matches wherever any of the fixes' patterns would, so a single scan
+    tells whether the whole group can be skipped
+    """
+    return re.compile('|'.join(f'(?:{pattern.pattern})' for pattern, _ in fixes))
+
+# Fix specific garbled text patterns seen in user's example. These rarely match, so they
+# sit behind one combined scan and are skipped when none of them can apply.
+OCR_NAME_FIXES = compile_fixes([
+    (r'LEACHE\s+L\s+U\s+UYL,?\s*A\s+W[IV]?ELDULL\s+L\s+LU,?', 'DEUTSCHE BANK AG'),
+    (r'L\s+E\s+A\s+C\s+H\s+E', 'DEUTSCHE'),
+    (r'U\s+U\s+Y\s+L', 'BANK'),
+    (r'W[IV]?ELDULL', 'COMPANY'),
+    (r'o\s*A\s+U\s*l\s+L\s*0\s+H\s*O\s*X', 'DOCUMENT'),
+])
+OCR_NAME_FIX_GATE = compile_fix_gate(OCR_NAME_FIXES)
+
+# Comprehensive OCR error fixes targeting specific issues, compiled once at import
+OCR_FIXES = compile_fixes([
+    # Fix spaced character patterns
+    (SPACED_CAPS_PATTERN, spaced_caps_joiner(4)),
+    
+    # Fix common character recognition errors
+    (r'\s+([,.;:!?])', r'\1'),
+    (r'([,.;:!?])([A-Za-z])', r'\1 \2'),
+    (r'\s+', ' '),
+    (r'(\d)\s+([A-Z])', r'\1 \2'),
+    
+    # Clean up artifact characters
+    (r'[|~`]+', ''),
+    (r'([a-z])([A-Z])', r'\1 \2'),  # Add space between camelCase
+])
+
 def fix_ocr_errors(text: str) -> str:
     """
     Fix common OCR errors for better readability
     """
-    import re
+    if OCR_NAME_FIX_GATE.search(text):
+        for pattern, replacement in OCR_NAME_FIXES:
+            text = pattern.sub(replacement, text)
     
-    # Comprehensive OCR error fixes targeting specific issues
-    fixes = [
-        # Fix specific garbled text patterns seen in user's example
-        (r'LEACHE\s+L\s+U\s+UYL,?\s*A\s+W[IV]?ELDULL\s+L\s+LU,?', 'DEUTSCHE BANK AG'),
-        (r'L\s+E\s+A\s+C\s+H\s+E', 'DEUTSCHE'),
-        (r'U\s+U\s+Y\s+L', 'BANK'),
-        (r'W[IV]?ELDULL', 'COMPANY'),
-        (r'o\s*A\s+U\s*l\s+L\s*0\s+H\s*O\s*X', 'DOCUMENT'),
-        
-        # Fix spaced character patterns
-        (r'\b([A-Z])\s+([A-Z])\s+([A-Z])\s+([A-Z])\b', r'\1\2\3\4'),
-        (r'\b([A-Z])\s+([A-Z])\s+([A-Z])\b', r'\1\2\3'),
-        (r'\b([A-Z])\s+([A-Z])\b', r'\1\2'),
-        
-        # Fix common character recognition errors
-        (r'\s+([,.;:!?])', r'\1'),
-        (r'([,.;:!?])([A-Za-z])', r'\1 \2'),
-        (r'\s+', ' '),
-        (r'(\d)\s+([A-Z])', r'\1 \2'),
-        
-        # Clean up artifact characters
-        (r'[|~`]+', ''),
-        (r'([a-z])([A-Z])', r'\1 \2'),  # Add space between camelCase
-    ]
-    
-    for pattern, replacement in fixes:
-        text = re.sub(pattern, replacement, text)
+    for pattern, replacement in OCR_FIXES:
+        text = pattern.sub(replacement, text)
     
     return text
 
+# Replace the specific garbled text pattern from user's example, behind one combined scan
+GARBLED_NAME_FIXES = compile_fixes([
+    (r'LEACHE\s+L\s+U\s+UYL,?\s*A\s+W[IV]?ELDULL\s+L\s+LU,?', 'DEUTSCHE BANK AG'),
+    (r'LEACHE.*?UYL.*?WIELDULL.*?LU', 'DEUTSCHE BANK'),
+    (r'L\s+E\s+A\s+C\s+H\s+E\s+L\s+U\s+U\s*Y\s*L', 'BANK NAME'),
+    (r'A\s+W[IV]?E?L?D?U?L?L?\s+L\s+L?U', 'COMPANY'),
+])
+GARBLED_NAME_FIX_GATE = compile_fix_gate(GARBLED_NAME_FIXES)
+
+# Target specific garbled patterns from user's example, compiled once at import
+GARBLED_TEXT_FIXES = compile_fixes([
+    # Fix spaced letters patterns
+    (SPACED_CAPS_PATTERN, spaced_caps_joiner(5)),
+    
+    # Remove artifact characters
+    (r'[|~`^]+', ''),
+    (r'\s+', ' '),
+])
+
 def clean_garbled_text(text: str) -> str:
     """
     Aggressive cleaning for garbled OCR text
     """
-    import re
-    
-    # Target specific garbled patterns from user's example
-    cleaning_patterns = [
-        # Replace the specific garbled text pattern
-        (r'LEACHE\s+L\s+U\s+UYL,?\s*A\s+W[IV]?ELDULL\s+L\s+LU,?', 'DEUTSCHE BANK AG'),
-        (r'LEACHE.*?UYL.*?WIELDULL.*?LU', 'DEUTSCHE BANK'),
-        (r'L\s+E\s+A\s+C\s+H\s+E\s+L\s+U\s+U\s*Y\s*L', 'BANK NAME'),
-        (r'A\s+W[IV]?E?L?D?U?L?L?\s+L\s+L?U', 'COMPANY'),
-        
-        # Fix spaced letters patterns
-        (r'\b([A-Z])\s+([A-Z])\s+([A-Z])\s+([A-Z])\s+([A-Z])\b', r'\1\2\3\4\5'),
-        (r'\b([A-Z])\s+([A-Z])\s+([A-Z])\s+([A-Z])\b', r'\1\2\3\4'),
-        (r'\b([A-Z])\s+([A-Z])\s+([A-Z])\b', r'\1\2\3'),
-        (r'\b([A-Z])\s+([A-Z])\b', r'\1\2'),
-        
-        # Remove artifact characters
-        (r'[|~`^]+', ''),
-        (r'\s+', ' '),
-    ]
-    
     cleaned = text
-    for pattern, replacement in cleaning_patterns:
-        cleaned = re.sub(pattern, replacement, cleaned)
+    if GARBLED_NAME_FIX_GATE.search(cleaned):
+        for pattern, replacement in GARBLED_NAME_FIXES:
+            cleaned = pattern.sub(replacement, cleaned)
+    
+    for pattern, replacement in GARBLED_TEXT_FIXES:
+        cleaned = pattern.sub(replacement, cleaned)
     
     return cleaned.strip()
 
+# Lines mentioning any of these start a new section
+SECTION_KEYWORDS = re.compile(r'invoice|certificate|letter|bill|document', re.IGNORECASE)
+
+# Fixed lines wrapped around every page's content and inserted at section breaks
+DOCUMENT_HEADER = ("=" * 60, "EXTRACTED DOCUMENT CONTENT", "=" * 60, "")
+SECTION_BREAK = ("", "-" * 40, "DOCUMENT SECTION", "-" * 40, "")
+DOCUMENT_FOOTER = ("", "=" * 60, "END OF DOCUMENT", "=" * 60)
+
+def wrap_words(words: List[str], width: int) -> List[str]:
+    """
+    Greedily pack words into lines of at most width characters (a longer word gets its own line)
+    """
+    wrapped = []
+    start = 0
+    line_length = 0
+    
+    # Track the running line length and only build each line once, when it is full
+    for index, word in enumerate(words):
+        if index > start and line_length + 1 + len(word) > width:
+            wrapped.append(" ".join(words[start:index]))
+            start = index
+            line_length = len(word)
+        elif index > start:
+            line_length += 1 + len(word)
+        else:
+            line_length = len(word)
+    
+    if start < len(words):
+        wrapped.append(" ".join(words[start:]))
+    return wrapped
+
 def add_document_structure(text: str) -> str:
     """
     Add readable document structure with proper formatting
     """
     lines = text.split('\n')
-    structured_lines = []
-    
     # Add document header
-    structured_lines.append("=" * 60)
-    structured_lines.append("EXTRACTED DOCUMENT CONTENT")
-    structured_lines.append("=" * 60)
-    structured_lines.append("")
+    structured_lines = list(DOCUMENT_HEADER)
     
     for i, line in enumerate(lines):
         line = line.strip()
         if line:
             # Add section breaks for new topics
-            if any(keyword in line.lower() for keyword in ['invoice', 'certificate', 'letter', 'bill', 'document']):
+            if SECTION_KEYWORDS.search(line):
                 if structured_lines and not structured_lines[-1].startswith('---') and len(structured_lines) > 4:
-                    structured_lines.append("")
-                    structured_lines.append("-" * 40)
-                    structured_lines.append("DOCUMENT SECTION")
-                    structured_lines.append("-" * 40)
-                    structured_lines.append("")
+                    structured_lines.extend(SECTION_BREAK)
             
             # Add line numbers for reference
-            structured_lines.append(f"{i+1:3d}. {line}")
+            structured_lines.append("%3d. %s" % (i + 1, line))
     
     # Add footer
-    structured_lines.append("")
-    structured_lines.append("=" * 60)
-    structured_lines.append("END OF DOCUMENT")
-    structured_lines.append("=" * 60)
+    structured_lines.extend(DOCUMENT_FOOTER)
     
     return '\n'.join(structured_lines)
 
+# Simple classification patterns in priority order (first type with any keyword present wins)
+SIMPLE_TYPE_PATTERNS = {
+    'Letter of Credit': ['letter of credit', 'documentary credit'],
+    'Commercial Invoice': ['commercial invoice', 'invoice'],
+    'Bill of Lading': ['bill of lading'],
+    'Certificate of Origin': ['certificate of origin'],
+    'Packing List': ['packing list'],
+    'Insurance Certificate': ['insurance'],
+    'Inspection Certificate': ['inspection'],
+    'Bill of Exchange': ['bill of exchange'],
+    'Bank Guarantee': ['guarantee'],
+    'Customs Declaration': ['customs'],
+    'Transport Document': ['transport'],
+}
+SIMPLE_TYPE_NAMES = list(SIMPLE_TYPE_PATTERNS)
+SIMPLE_TYPE_PATTERN_LISTS = list(SIMPLE_TYPE_PATTERNS.values())
+SIMPLE_TYPE_AUTOMATON = build_pattern_automaton(SIMPLE_TYPE_PATTERN_LISTS)
+
+# Pages are lowercased and scanned this many characters at a time, so a page whose
+# top-priority keyword turns up early is never lowercased in full
+CLASSIFY_CHUNK_CHARS = 2048
+CLASSIFY_CHUNK_OVERLAP = max(len(pattern) for patterns in SIMPLE_TYPE_PATTERN_LISTS for pattern in patterns) - 1
+
 def classify_document_simple(text: str) -> str:
     """
     Simple document classification
     """
-    text_lower = text.lower()
-    
-    # Simple classification patterns
-    if 'letter of credit' in text_lower or 'documentary credit' in text_lower:
-        return 'Letter of Credit'
-    elif 'commercial invoice' in text_lower or 'invoice' in text_lower:
-        return 'Commercial Invoice'
-    elif 'bill of lading' in text_lower:
-        return 'Bill of Lading'
-    elif 'certificate of origin' in text_lower:
-        return 'Certificate of Origin'
-    elif 'packing list' in text_lower:
-        return 'Packing List'
-    elif 'insurance' in text_lower:
-        return 'Insurance Certificate'
-    elif 'inspection' in text_lower:
-        return 'Inspection Certificate'
-    elif 'bill of exchange' in text_lower:
-        return 'Bill of Exchange'
-    elif 'guarantee' in text_lower:
-        return 'Bank Guarantee'
-    elif 'customs' in text_lower:
-        return 'Customs Declaration'
-    elif 'transport' in text_lower:
-        return 'Transport Document'
-    else:
-        return 'Trade Finance Document'
+    best_index = len(SIMPLE_TYPE_NAMES)
+    
+    # One pass per chunk finds every keyword at once; chunks overlap so no keyword is split
+    for start in range(0, len(text), CLASSIFY_CHUNK_CHARS):
+        chunk_lower = text[start:start + CLASSIFY_CHUNK_CHARS + CLASSIFY_CHUNK_OVERLAP].lower()
+        hits = find_pattern_hits(SIMPLE_TYPE_AUTOMATON, SIMPLE_TYPE_PATTERN_LISTS, chunk_lower)
+        best_index = min([best_index] + [index for index, type_hits in enumerate(hits) if type_hits])
+        
+        # Nothing later in the page can outrank the first type
+        if best_index == 0:
+            break
+    
+    if best_index < len(SIMPLE_TYPE_NAMES):
+        return SIMPLE_TYPE_NAMES[best_index]
+    return 'Trade Finance Document'
 
 def group_documents_simple(documents: List[Dict]) -> List[Dict]:
     """
@@ -322,6 +643,21 @@ def group_documents_simple(documents: List[Dict]) -> List[Dict]:
     
     return grouped
 
+# Separator between the pages of a merged document's text
+PAGE_BREAK = '\n\n--- Page Break ---\n\n'
+
+def write_json(result: Dict[str, Any]) -> None:
+    """
+    Write the result to stdout as indented JSON, with orjson's C encoder when available
+    """
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+    else:
+        # Stream the encoding instead of building the whole string first
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
 def merge_group_simple(group: List[Dict]) -> Dict:
     """
     Simple group merging
@@ -329,7 +665,7 @@ def merge_group_simple(group: List[Dict]) -> Dict:
     if len(group) == 1:
         return group[0]
     
-    # Merge multiple pages
+    # Merge multiple pages; groups are consecutive runs, so pages arrive in order
     all_pages = []
     all_texts = []
     
@@ -338,16 +674,16 @@ def merge_group_simple(group: List[Dict]) -> Dict:
         all_texts.append(doc['extracted_text'])
     
     doc_type = group[0]['document_type']
-    page_range = f"Pages {min(all_pages)}-{max(all_pages)}"
+    page_range = f"Pages {all_pages[0]}-{all_pages[-1]}"
     
     # Combine texts with page separators
-    combined_text = '\n\n--- Page Break ---\n\n'.join(all_texts)
+    combined_text = PAGE_BREAK.join(all_texts)
     
     return {
         'form_type': f"{doc_type} ({len(group)} pages)",
         'document_type': doc_type,
         'confidence': 0.8,
-        'pages': sorted(all_pages),
+        'pages': all_pages,
         'page_range': page_range,
         'extracted_text': combined_text,
         'text_length': len(combined_text)
@@ -359,4 +695,4 @@ if __name__ == "__main__":
         sys.exit(1)
     
     result = extract_documents_robustly(sys.argv[1])
-    print(json.dumps(result, indent=2))
\ No newline at end of file
+    write_json(result)
\ No newline at end of file
@@ -8,60 +8,111 @@ import sys
 import json
 import os
 import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
-import io
 from datetime import datetime
+from keywordClassifier import build_pattern_automaton, find_pattern_hits
+from ocrWorkers import OCR_WORKERS, create_ocr_api, map_ocr_requests
+from pdfSource import open_pdf
+
+# Tesseract settings: uniform block of text (psm 6), default engine, restricted character set
+OCR_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,:/()- '
+OCR_CONFIG = f'--psm 6 --oem 3 -c tessedit_char_whitelist={OCR_WHITELIST}'
+# The same settings for in-process tesserocr engines
+OCR_API_SETTINGS = {'psm': 'SINGLE_BLOCK', 'variables': {'tessedit_char_whitelist': OCR_WHITELIST}}
+
+FORM_PATTERNS = {
+    'SWIFT Message': ['swift', 'mt700', 'mt701', 'mt702', 'field', 'tag', 'sequence', '20:', '32a:', '50:'],
+    'Commercial Invoice': ['commercial', 'invoice', 'seller', 'buyer', 'amount', 'total'],
+    'Bill of Lading': ['bill', 'lading', 'shipper', 'consignee', 'vessel', 'cargo'],
+    'Certificate of Origin': ['certificate', 'origin', 'country', 'exporter', 'goods'],
+    'Letter of Credit': ['letter', 'credit', 'documentary', 'applicant', 'beneficiary'],
+    'Packing List': ['packing', 'list', 'package', 'weight', 'quantity', 'dimensions'],
+    'Insurance Certificate': ['insurance', 'certificate', 'policy', 'coverage', 'premium'],
+    'Bill of Exchange': ['bill', 'exchange', 'drawer', 'drawee', 'amount', 'date']
+}
+# One automaton over every form keyword, built once at import
+FORM_PATTERN_LISTS = list(FORM_PATTERNS.values())
+FORM_AUTOMATON = build_pattern_automaton(FORM_PATTERN_LISTS)
 
 class SimpleOCRProcessor:
     def __init__(self):
-        self.form_patterns = {
-            'SWIFT Message': ['swift', 'mt700', 'mt701', 'mt702', 'field', 'tag', 'sequence', '20:', '32a:', '50:'],
-            'Commercial Invoice': ['commercial', 'invoice', 'seller', 'buyer', 'amount', 'total'],
-            'Bill of Lading': ['bill', 'lading', 'shipper', 'consignee', 'vessel', 'cargo'],
-            'Certificate of Origin': ['certificate', 'origin', 'country', 'exporter', 'goods'],
-            'Letter of Credit': ['letter', 'credit', 'documentary', 'applicant', 'beneficiary'],
-            'Packing List': ['packing', 'list', 'package', 'weight', 'quantity', 'dimensions'],
-            'Insurance Certificate': ['insurance', 'certificate', 'policy', 'coverage', 'premium'],
-            'Bill of Exchange': ['bill', 'exchange', 'drawer', 'drawee', 'amount', 'date']
-        }
+        self.form_patterns = FORM_PATTERNS
     
     def extract_text_from_page(self, page):
         """Extract text from PDF page using direct OCR"""
+        # First try direct text extraction
+        result = self.extract_direct_text(page)
+        if result is not None:
+            return result
+        
+        # If no direct text, use OCR
+        return self.ocr_page(page)
+    
+    def extract_direct_text(self, page):
+        """(text, method) from the page's text layer, or None if it has no text and needs OCR"""
         try:
-            # First try direct text extraction
             direct_text = page.get_text()
             if direct_text.strip():
                 return direct_text.strip(), 'Direct PDF Text'
-            
-            # If no direct text, use OCR
+            # A page with no images or vector graphics has nothing to OCR; skip rendering it
+            if not page.get_image_info() and not page.get_cdrawings():
+                return "", 'Direct PDF Text'
+            return None
+        except Exception as e:
+            print(f"Text extraction error: {e}", file=sys.stderr)
+            return "", "Error"
+    
+    def ocr_page(self, page, api=None):
+        """OCR a PDF page that has no direct text, in-process when a tesserocr engine is given"""
+        # Imported on first use, so PDFs with a text layer on every page never load them
+        import pytesseract
+        from PIL import Image
+        
+        try:
             # Convert page to image with moderate resolution for speed
             mat = fitz.Matrix(2, 2)  # 2x scaling - balance of quality and speed
-            pix = page.get_pixmap(matrix=mat)
-            img_data = pix.tobytes("png")
+            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
             
-            # Convert to PIL Image
-            pil_image = Image.open(io.BytesIO(img_data))
+            # Wrap the grayscale samples as a PIL Image directly, without a PNG round-trip
+            pil_image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
             
             # Extract text using Tesseract with optimized settings
-            text = pytesseract.image_to_string(pil_image, config='--psm 6 --oem 3 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.,:/()- ')
+            if api is not None:
+                api.SetImage(pil_image)
+                text = api.GetUTF8Text()
+            else:
+                text = pytesseract.image_to_string(pil_image, config=OCR_CONFIG)
             return text.strip(), 'Tesseract OCR'
             
         except Exception as e:
             print(f"Text extraction error: {e}", file=sys.stderr)
             return "", "Error"
     
+    def ocr_pages(self, pdf_bytes, doc, page_nums):
+        """OCR the given pages, in parallel worker processes when there are several"""
+        if len(page_nums) > 1 and OCR_WORKERS > 1:
+            return list(map_ocr_requests(ocr_request_page, pdf_bytes, page_nums, OCR_API_SETTINGS,
+                                         chunked=True))
+        if not page_nums:
+            return []
+        api = create_ocr_api(**OCR_API_SETTINGS)
+        try:
+            return [self.ocr_page(doc[page_num], api) for page_num in page_nums]
+        finally:
+            if api is not None:
+                api.End()
+    
     def classify_document(self, text):
         """Classify document type based on extracted text"""
         if not text:
             return 'Trade Finance Document', 50
         
-        text_lower = text.lower()
+        # Find every form keyword in one pass over the text
+        hits = find_pattern_hits(FORM_AUTOMATON, FORM_PATTERN_LISTS, text.lower())
         best_match = 'Trade Finance Document'
         best_score = 50
         
-        for doc_type, keywords in self.form_patterns.items():
-            matches = sum(1 for keyword in keywords if keyword in text_lower)
+        for (doc_type, keywords), type_hits in zip(self.form_patterns.items(), hits):
+            matches = len(type_hits)
             if matches > 0:
                 confidence = min(95, max(65, (matches / len(keywords)) * 100 + 30))
                 if confidence > best_score:
@@ -73,52 +124,52 @@ class SimpleOCRProcessor:
     def process_document(self, file_path):
         """Process PDF document and extract text from all pages"""
         try:
-            doc = fitz.open(file_path)
-            detected_forms = []
-            
-            print(f"Processing {len(doc)} pages...", file=sys.stderr)
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # Extract text from page
-                text, method = self.extract_text_from_page(page)
+            doc, pdf_bytes = open_pdf(file_path)
+            with doc:
+                detected_forms = []
                 
-                if text:
-                    print(f"Page {page_num + 1}: Extracted {len(text)} characters using {method}", file=sys.stderr)
-                    # Show first 100 chars for verification
-                    preview = text[:100].replace('\n', ' ')
-                    print(f"Preview: {preview}...", file=sys.stderr)
-                else:
-                    text = f"Unable to extract text from page {page_num + 1}"
-                    method = "Failed"
-                    print(f"Page {page_num + 1}: Text extraction failed", file=sys.stderr)
+                print(f"Processing {len(doc)} pages...", file=sys.stderr)
                 
-                # Classify document type
-                doc_type, confidence = self.classify_document(text)
+                # Take direct text where pages have it, then OCR the rest together
+                page_results = [self.extract_direct_text(page) for page in doc]
+                ocr_page_nums = [page_num for page_num, result in enumerate(page_results) if result is None]
+                for page_num, result in zip(ocr_page_nums, self.ocr_pages(pdf_bytes, doc, ocr_page_nums)):
+                    page_results[page_num] = result
                 
-                # Create form data
-                form_data = {
-                    'id': f"form_{page_num + 1}",
-                    'formType': doc_type,
-                    'form_type': doc_type,
-                    'confidence': confidence,
-                    'page_numbers': [page_num + 1],
-                    'page_range': f"Page {page_num + 1}",
-                    'extracted_text': text,
-                    'fullText': text,
-                    'extractedFields': {
-                        'Full Extracted Text': text,
-                        'Text Length': len(text),
-                        'Processing Date': datetime.now().isoformat(),
-                        'Extraction Method': method
-                    },
-                    'processingMethod': f'Simple OCR ({method})',
-                    'status': 'completed'
-                }
-                detected_forms.append(form_data)
-            
-            doc.close()
+                for page_num, (text, method) in enumerate(page_results):
+                    if text:
+                        print(f"Page {page_num + 1}: Extracted {len(text)} characters using {method}", file=sys.stderr)
+                        # Show first 100 chars for verification
+                        preview = text[:100].replace('\n', ' ')
+                        print(f"Preview: {preview}...", file=sys.stderr)
+                    else:
+                        text = f"Unable to extract text from page {page_num + 1}"
+                        method = "Failed"
+                        print(f"Page {page_num + 1}: Text extraction failed", file=sys.stderr)
+                    
+                    # Classify document type
+                    doc_type, confidence = self.classify_document(text)
+                    
+                    # Create form data
+                    form_data = {
+                        'id': f"form_{page_num + 1}",
+                        'formType': doc_type,
+                        'form_type': doc_type,
+                        'confidence': confidence,
+                        'page_numbers': [page_num + 1],
+                        'page_range': f"Page {page_num + 1}",
+                        'extracted_text': text,
+                        'fullText': text,
+                        'extractedFields': {
+                            'Full Extracted Text': text,
+                            'Text Length': len(text),
+                            'Processing Date': datetime.now().isoformat(),
+                            'Extraction Method': method
+                        },
+                        'processingMethod': f'Simple OCR ({method})',
+                        'status': 'completed'
+                    }
+                    detected_forms.append(form_data)
             
             return {
                 'status': 'success',
@@ -136,6 +187,10 @@ class SimpleOCRProcessor:
                 'detected_forms': []
             }
 
+def ocr_request_page(doc, page_num, api=None):
+    """Worker pool entry point: OCR one page"""
+    return SimpleOCRProcessor().ocr_page(doc[page_num], api)
+
 def main():
     if len(sys.argv) != 2:
         print(json.dumps({'error': 'Usage: python3 simpleOCR.py <file_path>'}))
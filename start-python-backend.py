@@ -8,6 +8,7 @@ import os
 import sys
 import subprocess
 import logging
+from importlib.metadata import distribution, PackageNotFoundError
 from pathlib import Path
 
 # Configure logging
@@ -17,8 +18,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Other distributions that provide the same import as a required package
+PACKAGE_ALTERNATIVES = {
+    'opencv-python': ['opencv-python-headless', 'opencv-contrib-python', 'opencv-contrib-python-headless'],
+}
+
+def is_installed(package):
+    """Whether the package, or a distribution that stands in for it, is installed"""
+    for name in [package] + PACKAGE_ALTERNATIVES.get(package, []):
+        try:
+            distribution(name)
+            return True
+        except PackageNotFoundError:
+            pass
+    return False
+
 def check_python_dependencies():
-    """Check and install required Python packages"""
+    """Check and install required Python packages (skipped when SKIP_DEP_CHECK=1)"""
+    if os.getenv('SKIP_DEP_CHECK') == '1':
+        logger.info("Skipping Python dependency check (SKIP_DEP_CHECK=1)")
+        return True
+    
     required_packages = [
         'fastapi',
         'uvicorn',
@@ -40,22 +60,18 @@ def check_python_dependencies():
     
     logger.info("Checking Python dependencies...")
     
-    missing_packages = []
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-        except ImportError:
-            missing_packages.append(package)
+    # Look packages up by distribution name, since several import under another name
+    # (PyMuPDF as fitz, opencv-python as cv2, Pillow as PIL)
+    missing_packages = [package for package in required_packages if not is_installed(package)]
     
     if missing_packages:
         logger.info(f"Installing missing packages: {missing_packages}")
-        for package in missing_packages:
-            try:
-                subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
-                logger.info(f"Successfully installed {package}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Failed to install {package}: {e}")
-                return False
+        try:
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', *missing_packages])
+            logger.info(f"Successfully installed {missing_packages}")
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Failed to install {missing_packages}: {e}")
+            return False
     
     logger.info("All Python dependencies are satisfied")
     return True
@@ -92,14 +108,22 @@ def start_fastapi_server():
         # Import and run the FastAPI app
         import uvicorn
         
+        # Auto-reload and per-request access logging are for development only
+        # (UVICORN_RELOAD=1, UVICORN_ACCESS_LOG=1); without reload, serve from one
+        # worker process per core (UVICORN_WORKERS to override)
+        reload = os.getenv('UVICORN_RELOAD', '0') == '1'
+        access_log = os.getenv('UVICORN_ACCESS_LOG', '0') == '1'
+        workers = 1 if reload else int(os.getenv('UVICORN_WORKERS', os.cpu_count() or 1))
+        
         # Run the server
         uvicorn.run(
             "server.pythonBackend:app",
             host="0.0.0.0",
             port=8000,
-            reload=True,
+            reload=reload,
+            workers=workers,
             log_level="info",
-            access_log=True
+            access_log=access_log
         )
         
     except Exception as e: